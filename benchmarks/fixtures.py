@@ -0,0 +1,352 @@
+"""
+Generators of synthetic, format-exact stand-ins for the upstream dataset files.
+
+Every generator writes the files a loader downloads (same names, containers and
+encodings) with random content, `scale` times the size of the real dataset.
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import pickle
+import struct
+import tarfile
+import zipfile
+import numpy as np
+
+EMNIST_SIZES = {
+    "byclass": (697932, 116323, 62),
+    "bymerge": (697932, 116323, 47),
+    "balanced": (112800, 18800, 47),
+    "letters": (124800, 20800, 26),
+    "digits": (240000, 40000, 10),
+    "mnist": (60000, 10000, 10),
+}
+
+
+def scaled(n, scale):
+    return max(int(round(n * scale)), 1)
+
+
+def idx_bytes(array_):
+    """
+    Returns:
+        bytes of `array_` (uint8) in the IDX format
+    """
+    header = struct.pack(">HBB", 0, 0x08, array_.ndim)
+    header += struct.pack(">" + "I" * array_.ndim, *array_.shape)
+
+    return header + np.ascontiguousarray(array_, dtype=np.uint8).tobytes()
+
+
+def emnist(directory, scale=0.01, datasets=("mnist",), seed=0):
+    """
+    Write `gzip.zip` with the gzipped IDX members of the EMNIST `datasets`.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    with zipfile.ZipFile(os.path.join(directory, "gzip.zip"), "w") as f:
+        for dataset in datasets:
+            train, test, classes = EMNIST_SIZES[dataset]
+            for split, n in (
+                ("train", scaled(train, scale)),
+                ("test", scaled(test, scale)),
+            ):
+                prefix = "gzip/emnist-{}-{}-".format(dataset, split)
+                images = rng.integers(0, 256, (n, 28, 28), dtype=np.uint8)
+                labels = rng.integers(0, classes, n, dtype=np.uint8)
+                f.writestr(
+                    prefix + "images-idx3-ubyte.gz", gzip.compress(idx_bytes(images))
+                )
+                f.writestr(
+                    prefix + "labels-idx1-ubyte.gz", gzip.compress(idx_bytes(labels))
+                )
+                f.writestr(prefix + "mapping.txt", b"")
+
+
+def fashion_mnist(directory, scale=0.01, seed=0):
+    """
+    Write the four gzipped IDX files of Fashion-MNIST.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    for prefix, n in (("train", scaled(60000, scale)), ("t10k", scaled(10000, scale))):
+        images = rng.integers(0, 256, (n, 28, 28), dtype=np.uint8)
+        labels = rng.integers(0, 10, n, dtype=np.uint8)
+        for name, array_ in (
+            ("-images-idx3-ubyte.gz", images),
+            ("-labels-idx1-ubyte.gz", labels),
+        ):
+            with open(os.path.join(directory, prefix + name), "wb") as f:
+                f.write(gzip.compress(idx_bytes(array_)))
+
+
+def _add(f, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    f.addfile(info, io.BytesIO(data))
+
+
+def _names(prefix, n):
+    return ("\n".join("{}{}".format(prefix, i) for i in range(n)) + "\n").encode(
+        "utf-8"
+    )
+
+
+def cifar10(directory, scale=0.01, seed=0):
+    """
+    Write `cifar-10-python.tar.gz` and `cifar-10-binary.tar.gz`.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    n = scaled(10000, scale)
+
+    with tarfile.open(os.path.join(directory, "cifar-10-python.tar.gz"), "w:gz") as f:
+        for name in ["data_batch_{}".format(i) for i in range(1, 6)] + ["test_batch"]:
+            batch = {
+                b"batch_label": name.encode("utf-8"),
+                b"labels": rng.integers(0, 10, n).tolist(),
+                b"data": rng.integers(0, 256, (n, 3072), dtype=np.uint8),
+                b"filenames": [b"image.png"] * n,
+            }
+            _add(f, "cifar-10-batches-py/" + name, pickle.dumps(batch))
+
+        meta = {
+            b"label_names": [b"class_%d" % i for i in range(10)],
+            b"num_cases_per_batch": n,
+            b"num_vis": 3072,
+        }
+        _add(f, "cifar-10-batches-py/batches.meta", pickle.dumps(meta))
+
+    with tarfile.open(os.path.join(directory, "cifar-10-binary.tar.gz"), "w:gz") as f:
+        for name in ["data_batch_{}.bin".format(i) for i in range(1, 6)] + [
+            "test_batch.bin"
+        ]:
+            records = rng.integers(0, 256, (n, 3073), dtype=np.uint8)
+            records[:, 0] = rng.integers(0, 10, n)
+            _add(f, "cifar-10-batches-bin/" + name, records.tobytes())
+
+        _add(f, "cifar-10-batches-bin/batches.meta.txt", _names("class_", 10) + b"\n")
+
+
+def cifar100(directory, scale=0.01, seed=0):
+    """
+    Write `cifar-100-python.tar.gz` and `cifar-100-binary.tar.gz`.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    sizes = (("train", scaled(50000, scale)), ("test", scaled(10000, scale)))
+
+    with tarfile.open(os.path.join(directory, "cifar-100-python.tar.gz"), "w:gz") as f:
+        for name, n in sizes:
+            batch = {
+                b"fine_labels": rng.integers(0, 100, n).tolist(),
+                b"coarse_labels": rng.integers(0, 20, n).tolist(),
+                b"data": rng.integers(0, 256, (n, 3072), dtype=np.uint8),
+            }
+            _add(f, "cifar-100-python/" + name, pickle.dumps(batch))
+
+        meta = {
+            b"fine_label_names": [b"fine_%d" % i for i in range(100)],
+            b"coarse_label_names": [b"coarse_%d" % i for i in range(20)],
+        }
+        _add(f, "cifar-100-python/meta", pickle.dumps(meta))
+
+    with tarfile.open(os.path.join(directory, "cifar-100-binary.tar.gz"), "w:gz") as f:
+        for name, n in sizes:
+            records = rng.integers(0, 256, (n, 3074), dtype=np.uint8)
+            records[:, 0] = rng.integers(0, 20, n)
+            records[:, 1] = rng.integers(0, 100, n)
+            _add(f, "cifar-100-binary/{}.bin".format(name), records.tobytes())
+
+        _add(f, "cifar-100-binary/coarse_label_names.txt", _names("coarse_", 20))
+        _add(f, "cifar-100-binary/fine_label_names.txt", _names("fine_", 100))
+
+
+def _write(directory, name, data, compress=False):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(gzip.compress(data) if compress else data)
+
+
+def esl_digit(directory, scale=0.01, seed=0):
+    """
+    Write the gzipped whitespace tables of the ESL zip code digits.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # like the real files, every row of zip.train ends with a space and the rows of
+    # zip.test do not
+    for name, n, newline in (
+        ("zip.train.gz", scaled(7291, scale), " \n"),
+        ("zip.test.gz", scaled(2007, scale), "\n"),
+    ):
+        table = np.column_stack([rng.integers(0, 10, n), rng.uniform(-1, 1, (n, 256))])
+        buffer = io.BytesIO()
+        np.savetxt(buffer, table, fmt="%.4f", newline=newline)
+        _write(directory, name, buffer.getvalue(), compress=True)
+
+    _write(directory, "zip.info.txt", b"Normalized handwritten digits (synthetic)\n")
+    _write(directory, "zip.digits", b"synthetic\n")
+
+
+def esl_prostate(directory, scale=0.01, seed=0):
+    """
+    Write the tab-separated prostate cancer table with its header and T/F column.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    columns = ["lcavol", "lweight", "age", "lbph", "svi", "lcp", "gleason", "pgg45"]
+    lines = ["\t" + "\t".join(columns + ["lpsa", "train"])]
+
+    for i in range(scaled(97, scale)):
+        row = [
+            rng.normal(),
+            rng.normal(3.5),
+            rng.integers(40, 80),
+            rng.normal(),
+            rng.integers(0, 2),
+            rng.normal(),
+            rng.integers(6, 10),
+            rng.integers(0, 100),
+            rng.normal(2.5),
+        ]
+        values = ["{:.7g}".format(v) for v in row]
+        lines.append(
+            "\t".join([str(i + 1)] + values + ["T" if rng.random() < 0.7 else "F"])
+        )
+
+    _write(directory, "prostate.data", ("\n".join(lines) + "\n").encode("utf-8"))
+    _write(directory, "prostate.info.txt", b"Prostate cancer data (synthetic)\n")
+
+
+def esl_spam(directory, scale=0.01, seed=0):
+    """
+    Write the space-separated spam table (57 features and the label) and its train/test
+    indicator.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    n = scaled(4601, scale)
+
+    table = np.column_stack(
+        [
+            np.round(rng.exponential(0.3, (n, 54)) * (rng.random((n, 54)) < 0.2), 2),
+            np.round(rng.exponential(5.0, n), 3),
+            rng.integers(1, 1000, (n, 2)),
+            rng.integers(0, 2, n),
+        ]
+    )
+    buffer = io.BytesIO()
+    np.savetxt(buffer, table, fmt="%.10g")
+    _write(directory, "spam.data", buffer.getvalue())
+    _write(
+        directory,
+        "spam.traintest",
+        "\n".join(str(int(rng.random() < 1 / 3)) for _ in range(n)).encode() + b"\n",
+    )
+    _write(directory, "spam.info.txt", b"Spam e-mail database (synthetic)\n")
+
+
+def esl_mixture(directory, scale=0.01, seed=0):
+    """
+    Write `ESL.mixture.rda`, a gzipped R (XDR, version 2) serialization of the list
+    `ESL.mixture` with the `x`, `y`, `means`, `px1` and `px2` members.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    n = scaled(200, scale)
+
+    x = rng.normal(size=(n, 2))
+    y = (np.arange(n) >= n // 2).astype(np.float64)
+    members = [
+        ("x", _r_real(x)),
+        ("y", _r_real(y)),
+        ("means", _r_real(rng.normal(size=(20, 2)))),
+        ("px1", _r_real(np.linspace(-2.6, 4.2, 69))),
+        ("px2", _r_real(np.linspace(-2.0, 2.9, 99))),
+    ]
+
+    data = b"RDX2\nX\n" + _r_int(2, 0x030602, 0x020300)
+    data += _r_int(2 | 1 << 10) + _r_symbol("ESL.mixture") + _r_list(members)
+    data += _r_int(254)
+
+    _write(directory, "ESL.mixture.rda", data, compress=True)
+
+
+def _r_int(*values):
+    return struct.pack(">" + "i" * len(values), *values)
+
+
+def _r_chars(value):
+    data = value.encode("utf-8")
+    # CHARSXP flagged as UTF-8
+    return _r_int(9 | 64 << 12, len(data)) + data
+
+
+def _r_symbol(name):
+    return _r_int(1) + _r_chars(name)
+
+
+def _r_attributes(*pairs):
+    data = b""
+    for tag, value in pairs:
+        data += _r_int(2 | 1 << 10) + _r_symbol(tag) + value
+
+    return data + _r_int(254)
+
+
+def _r_real(array_):
+    array_ = np.asarray(array_, dtype=">f8")
+    data = _r_int(14 | (1 << 9 if array_.ndim > 1 else 0), array_.size)
+    data += array_.ravel(order="F").tobytes()
+
+    if array_.ndim > 1:
+        dim = _r_int(13, array_.ndim, *array_.shape)
+        data += _r_attributes(("dim", dim))
+
+    return data
+
+
+def _r_list(members):
+    data = _r_int(19 | 1 << 9, len(members))
+    data += b"".join(value for _, value in members)
+    names = _r_int(16, len(members)) + b"".join(_r_chars(name) for name, _ in members)
+
+    return data + _r_attributes(("names", names))
+
+
+GENERATORS = {
+    "emnist": emnist,
+    "fashion-mnist": fashion_mnist,
+    "cifar10": cifar10,
+    "cifar100": cifar100,
+    "esl-mixture": esl_mixture,
+    "esl-prostate": esl_prostate,
+    "esl-spam": esl_spam,
+    "esl-digit": esl_digit,
+}
+
+
+def checksums(directory, filenames):
+    """
+    Returns:
+        Checksum manifest (`{filename: {"sha256": ..., "size": ...}}`) of the generated
+            files, in the format of the loaders' `checksums` argument
+    """
+    manifest = {}
+    for filename in filenames:
+        path = os.path.join(directory, filename)
+        hash_ = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hash_.update(chunk)
+        manifest[filename] = {
+            "sha256": hash_.hexdigest(),
+            "size": os.path.getsize(path),
+        }
+
+    return manifest
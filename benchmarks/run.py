@@ -0,0 +1,334 @@
+"""
+Offline benchmark of the dataset loaders.
+
+Synthetic fixtures (see `benchmarks.fixtures`) are served from a local HTTP server and
+every loader is timed stage by stage, each stage in a fresh process so its peak RSS is
+its own:
+
+    download     fetch and verify the files from the local server
+    decompress   inflate the downloaded archives without parsing them
+    parse        `load()` without the cache (extract, decompress and parse)
+    cache_write  `load()` parsing into an empty cache
+    cache_read   `load()` from the cache
+                 (both cache stages are skipped for the loaders without a cache)
+    transform    `load()` with layout="NCHW", dtype="float32" and scale=1/255
+    batches      one shuffled epoch of `iter_batches(batch_size=256)`
+
+Usage:
+    python -m benchmarks.run --scale 0.05 --output results.json
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from benchmarks import fixtures
+from benchmarks.server import serve
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# benchmark name -> registry name, constructor arguments and output kind: "images"
+# (takes the layout/dtype options), "arrays" (has splits) or "frame" (DataFrame)
+BENCHMARKS = {
+    "emnist": ("emnist", {}, "images"),
+    "fashion-mnist": ("fashion-mnist", {}, "images"),
+    "cifar10": ("cifar10", {}, "images"),
+    "cifar10-binary": ("cifar10", {"format": "binary"}, "images"),
+    "cifar100": ("cifar100", {}, "images"),
+    "cifar100-binary": ("cifar100", {"format": "binary"}, "images"),
+    "esl-mixture": ("esl-mixture", {}, "arrays"),
+    "esl-prostate": ("esl-prostate", {}, "frame"),
+    "esl-spam": ("esl-spam", {}, "arrays"),
+    "esl-digit": ("esl-digit", {}, "arrays"),
+}
+
+STAGES = (
+    "download",
+    "decompress",
+    "parse",
+    "cache_write",
+    "cache_read",
+    "transform",
+    "batches",
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--scale", type=float, default=0.05, help="fraction of the real dataset sizes"
+    )
+    parser.add_argument(
+        "--datasets", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS)
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every stage")
+    parser.add_argument("--output", help="JSON file (default: standard output)")
+    parser.add_argument(
+        "--workdir", help="directory for fixtures and downloads (default: temporary)"
+    )
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ml_datasets-bench-")
+    results = []
+
+    try:
+        fixture_dir = os.path.join(workdir, "fixtures")
+        for name in sorted({BENCHMARKS[name][0] for name in args.datasets}):
+            fixtures.GENERATORS[name](os.path.join(fixture_dir, name), args.scale)
+
+        with serve(fixture_dir) as url:
+            for name in args.datasets:
+                for stage in args.stages:
+                    for _ in range(args.repeat):
+                        result = run_stage(name, stage, url, workdir)
+                        if result is not None:
+                            results.append(result)
+                            print(_summary(result), file=sys.stderr)
+
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(args.scale), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def run_stage(name, stage, url, workdir):
+    """
+    Run one stage in a fresh interpreter.
+
+    Returns:
+        dict of measurements, or None if the stage does not apply to the loader
+    """
+    dataset, _, _ = BENCHMARKS[name]
+    target_dir = os.path.join(workdir, "downloads", name)
+
+    if stage == "download":
+        shutil.rmtree(target_dir, ignore_errors=True)
+    os.makedirs(target_dir, exist_ok=True)
+    if stage in ("parse", "cache_write"):
+        _clean(target_dir)
+
+    pool = multiprocessing.get_context("spawn").Pool(1)
+    try:
+        result = pool.apply(
+            _measure, (name, stage, url + dataset + "/", target_dir, workdir)
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+    return result
+
+
+def _measure(name, stage, url, target_dir, workdir):
+    from ml_datasets import registry
+
+    dataset, kwargs, kind = BENCHMARKS[name]
+    if (stage == "transform" and kind != "images") or (
+        stage == "batches" and kind == "frame"
+    ):
+        return None
+
+    source_dir = os.path.join(workdir, "fixtures", dataset)
+    checksums = fixtures.checksums(
+        source_dir,
+        [
+            f
+            for f in registry.info(dataset)["files"]
+            if os.path.isfile(os.path.join(source_dir, f))
+        ],
+    )
+
+    def make(**options):
+        ds = registry.get(
+            dataset,
+            target_dir=target_dir,
+            verbose=False,
+            checksums=checksums,
+            **dict(kwargs, **options)
+        )
+        ds.url = url
+        return ds
+
+    filenames = make().target_filename
+    filenames = [
+        os.path.basename(f)
+        for f in (filenames if isinstance(filenames, list) else [filenames])
+    ]
+
+    baseline = _peak_rss()
+    start = time.perf_counter()
+
+    if stage == "download":
+        make().download_file()
+        size = _size(target_dir, filenames)
+
+    elif stage == "decompress":
+        size = sum(_inflate(os.path.join(target_dir, f)) for f in filenames)
+
+    elif stage == "parse":
+        output = make(cache=False).load()
+        size = _size(target_dir, filenames)
+
+    elif stage in ("cache_write", "cache_read"):
+        ds = make(stats=True)
+        output = ds.load()
+        # a loader without a cache parses again, so there is no warm load to time
+        if ds.last_load_stats.cache is None:
+            return None
+        size = _nbytes(output)
+
+    elif stage == "transform":
+        options = {"layout": "NCHW", "dtype": "float32", "scale": 1 / 255}
+        output = make(cache=False, **options).load()
+        size = _nbytes(output)
+
+    else:
+        size = 0
+        for x, y in make().iter_batches(batch_size=256, shuffle=True, seed=0):
+            size += x.nbytes + y.nbytes
+
+    seconds = time.perf_counter() - start
+
+    return {
+        "dataset": name,
+        "stage": stage,
+        "seconds": seconds,
+        "bytes": size,
+        "mb_per_s": size / 1e6 / seconds if seconds else None,
+        "peak_rss_mb": _peak_rss(),
+        "baseline_rss_mb": baseline,
+    }
+
+
+def _clean(target_dir):
+    # cached arrays and IDX sidecars, not the downloads or their markers
+    if os.path.isdir(target_dir):
+        for f in os.listdir(target_dir):
+            if f.endswith((".npy", ".json", ".idx")):
+                os.remove(os.path.join(target_dir, f))
+
+
+def _inflate(filename):
+    """
+    Read an archive through its decompressor, discarding the data.
+
+    Returns:
+        Number of decompressed bytes
+    """
+    size = 0
+
+    if filename.endswith(".zip"):
+        with zipfile.ZipFile(filename) as f_zip:
+            for member in f_zip.namelist():
+                with f_zip.open(member) as f:
+                    if member.endswith(".gz"):
+                        f = gzip.GzipFile(fileobj=f)
+                    size += _drain(f)
+
+    elif filename.endswith((".tar.gz", ".tgz")):
+        with tarfile.open(filename, "r|*") as f_tar:
+            for member in f_tar:
+                if member.isfile():
+                    size += _drain(f_tar.extractfile(member))
+
+    elif filename.endswith((".gz", ".rda")):
+        with gzip.open(filename, "rb") as f:
+            size += _drain(f)
+
+    else:
+        size += os.path.getsize(filename)
+
+    return size
+
+
+def _drain(f):
+    size = 0
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        size += len(chunk)
+
+    return size
+
+
+def _size(directory, filenames):
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in filenames)
+
+
+def _nbytes(output):
+    output = output if isinstance(output, tuple) else (output,)
+    return int(sum(getattr(array_, "nbytes", 0) or 0 for array_ in output))
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _summary(result):
+    return "{:16} {:12} {:8.3f}s {:10.1f} MB/s {:8.1f} MB RSS".format(
+        result["dataset"],
+        result["stage"],
+        result["seconds"],
+        result["mb_per_s"] or 0,
+        result["peak_rss_mb"] or 0,
+    )
+
+
+def environment(scale):
+    import numpy
+
+    try:
+        from importlib.metadata import version
+
+        package_version = version("ml-datasets")
+    except Exception:
+        package_version = None
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "ml_datasets": package_version,
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Local HTTP stand-in for the dataset hosts, with Range support so resumed and segmented
+downloads take the same code paths as against the real servers.
+"""
+
+import contextlib
+import functools
+import http.server
+import os
+import re
+import threading
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    `SimpleHTTPRequestHandler` answering `Range: bytes=start-[end]` requests with 206
+    (or 416 past the end of the file).
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        f = open(path, "rb")
+        f.seek(start)
+        self._remaining = end - start + 1
+
+        return f
+
+    def copyfile(self, source, outputfile):
+        while self._remaining > 0:
+            chunk = source.read(min(1 << 16, self._remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self._remaining -= len(chunk)
+
+
+@contextlib.contextmanager
+def serve(directory, handler=RangeHandler):
+    """
+    Serve `directory` on an ephemeral localhost port in a background thread.
+
+    Arguments:
+        directory: directory to serve
+        handler: request handler class, `RangeHandler` or a subclass of it
+
+    Yields:
+        Base URL of the server, e.g. "http://127.0.0.1:8000/"
+    """
+    handler = functools.partial(handler, directory=directory)
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield "http://127.0.0.1:{}/".format(httpd.server_address[1])
+
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,8 @@
+from ml_datasets.registry import get, info, list_datasets, register
+
+# `ml_datasets.list()`, left out of `__all__` so that `from ml_datasets import *`
+# does not shadow the builtin; only the registry is imported here, loader modules (and
+# numpy, pandas, matplotlib, ...) are imported on first use by `get`
+list = list_datasets
+
+__all__ = ["get", "info", "list_datasets", "register"]
@@ -1,75 +1,199 @@
 import os
 import tarfile
 import pickle
-from numpy import array, vstack
+from numpy import array, asarray, ascontiguousarray, empty, int64, uint8
 from ml_datasets.dataset import Dataset
+from ml_datasets.layout import (
+    as_dtype,
+    check_dtype,
+    check_layout,
+    check_transform,
+    to_layout,
+)
+
+
+def iter_tar(filename):
+    """
+    Walk a (compressed) tar archive exactly once, in stream order.
+
+    Yields:
+        Tuple: `(basename, size, file object)` for every regular member; the file object
+            is only valid until the next member is requested
+    """
+    with tarfile.open(filename, "r|*") as f_in:
+        for member in f_in:
+            if member.isfile():
+                yield os.path.basename(member.name), member.size, f_in.extractfile(
+                    member
+                )
+
+
+def read_records(f, size, record_size, out=None):
+    """
+    Read `size` bytes of fixed-size records from `f` into a uint8 array.
+
+    Arguments:
+        f: binary file object
+        size: number of bytes to read
+        record_size: number of bytes per record
+        out: optional C-contiguous uint8 array of `size` bytes to read into
+
+    Returns:
+        numpy array of shape `(size // record_size, record_size)`
+    """
+    if out is None:
+        out = empty((size // record_size, record_size), dtype=uint8)
+
+    view = memoryview(out.reshape(-1))
+    n = 0
+    while n < size:
+        k = f.readinto(view[n:])
+        if not k:
+            raise EOFError("truncated record file")
+        n += k
+
+    return out
+
+
+def read_names(f):
+    return [x.strip() for x in f.read().decode("utf-8").splitlines() if x.strip()]
+
+
+def check_format(format_):
+    if format_ not in ["python", "binary"]:
+        raise ValueError(
+            "incorrect value for arg: format (python or binary only): {}".format(
+                format_
+            )
+        )
+
+    return format_
 
 
 class CIFAR10(Dataset):
     def __init__(self, *args, **kwargs):
         kwargs["url"] = "https://www.cs.toronto.edu/~kriz/"
-        kwargs["filename"] = "cifar-10-python.tar.gz"
+        kwargs["format"] = check_format(kwargs.get("format", "python"))
+        kwargs["filename"] = "cifar-10-{}.tar.gz".format(kwargs["format"])
+        kwargs["checksums"] = kwargs.get(
+            "checksums",
+            {
+                "cifar-10-python.tar.gz": {
+                    "md5": "c58f30108f718f92721af3b95e74349a",
+                    "size": 170498071,
+                },
+                "cifar-10-binary.tar.gz": {
+                    "md5": "c32a1d4ab5d03f1284b67883e8d87530",
+                    "size": 162452693,
+                },
+            },
+        )
 
         super(CIFAR10, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
+        self.format = kwargs["format"]
+        self.layout = check_layout(kwargs.get("layout", "NHWC"))
+        self.transform = check_transform(kwargs)
+        self.label_dtype = check_dtype(kwargs.get("label_dtype"))
+        self.num_batches = 5
 
     def load(self):
         if self.verbose:
             print("Retrieving CIFAR-10 dataset...")
-        self.download_file()
-        return self.__parse_file(self.target_filename)
+        parse_file = (
+            self.__parse_binary if self.format == "binary" else self.__parse_file
+        )
+        return self.load_cached(
+            parse_file,
+            self.target_filename,
+            attrs=("meta",),
+            layout=self.layout,
+            label_dtype=self.label_dtype,
+            **self.transform
+        )
 
     def __parse_file(self, filename):
-        dir_name = os.path.dirname(filename)
-        x_train = array([])
-        y_train = array([])
-        x_test = array([])
-        y_test = array([])
-
-        with tarfile.open(filename) as f_in:
-            datasets = [f for f in f_in.getnames() if "_batch" in f]
+        x_train = y_train = x_test = y_test = None
+
+        for name, _, f in iter_tar(filename):
+            if name.startswith("data_batch_"):
+                with self._phase("unpickle"):
+                    batch = pickle.load(f, encoding="bytes")
+                size = len(batch[b"labels"])
+
+                if x_train is None:
+                    x_train = empty((self.num_batches * size, 3072), dtype=uint8)
+                    y_train = empty(
+                        self.num_batches * size, dtype=self.label_dtype or int64
+                    )
+
+                i = (int(name.rsplit("_", 1)[1]) - 1) * size
+                x_train[i : i + size] = batch[b"data"]
+                y_train[i : i + size] = batch[b"labels"]
+
+            elif name == "test_batch":
+                with self._phase("unpickle"):
+                    batch = pickle.load(f, encoding="bytes")
+                x_test = asarray(batch[b"data"], dtype=uint8)
+                y_test = array(batch[b"labels"], dtype=self.label_dtype or int64)
+
+            elif name == "batches.meta":
+                with self._phase("unpickle"):
+                    self.meta = pickle.load(f, encoding="bytes")
+                self.meta = self.bytes_to_utf(self.meta)
+                self.meta["label_names"] = [
+                    x.decode("utf-8") for x in self.meta["label_names"]
+                ]
 
-            for dataset in datasets:
-                dataset_full_path = os.path.join(dir_name, dataset)
+        return (
+            self.to_layout(x_train.reshape(-1, 3, 32, 32)),
+            y_train,
+            self.to_layout(x_test.reshape(-1, 3, 32, 32)),
+            y_test,
+        )
 
-                if not os.path.isfile(dataset_full_path):
-                    f_in.extract(dataset, path=dir_name)
+    def __parse_binary(self, filename):
+        records = test_records = None
 
-                with open(dataset_full_path, "rb") as f:
-                    temp = pickle.load(f, encoding="bytes")
-                    temp = self.bytes_to_utf(temp)
-                    x_temp = temp["data"]
-                    y_temp = array(temp["labels"]).reshape(-1, 1)
+        for name, size, f in iter_tar(filename):
+            if name.startswith("data_batch_"):
+                if records is None:
+                    batch_size = size // 3073
+                    records = empty((self.num_batches * batch_size, 3073), dtype=uint8)
 
-                    if "test" not in dataset:
-                        x_train = vstack([x_train, x_temp]) if x_train.size else x_temp
-                        y_train = vstack([y_train, y_temp]) if y_train.size else y_temp
+                i = (int(name[len("data_batch_") : -len(".bin")]) - 1) * batch_size
+                with self._phase("extract"):
+                    read_records(f, size, 3073, out=records[i : i + batch_size])
 
-                    else:
-                        x_test = x_temp
-                        y_test = y_temp
+            elif name == "test_batch.bin":
+                with self._phase("extract"):
+                    test_records = read_records(f, size, 3073)
 
-            meta = [f for f in f_in.getnames() if "meta" in f][0]
-            meta_full_path = os.path.join(dir_name, meta)
+            elif name == "batches.meta.txt":
+                self.meta = {"label_names": read_names(f)}
 
-            if not os.path.isfile(meta_full_path):
-                f_in.extract(meta, path=dir_name)
+        if records is None or test_records is None:
+            raise ValueError(
+                "{} has no data_batch_*.bin or test_batch.bin member".format(filename)
+            )
 
-            with open(meta_full_path, "rb") as f:
-                self.meta = pickle.load(f, encoding="bytes")
-                self.meta = self.bytes_to_utf(self.meta)
-                self.meta["label_names"] = [
-                    x.decode("utf-8") for x in self.meta["label_names"]
-                ]
+        self.meta["num_cases_per_batch"] = batch_size
+        self.meta["num_vis"] = 3072
 
+        # copied out, a column view would keep all the records alive uncached
         return (
-            x_train.reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1),
-            y_train.reshape(-1),
-            x_test.reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1),
-            y_test.reshape(-1),
+            self.to_layout(records[:, 1:].reshape(-1, 3, 32, 32)),
+            as_dtype(ascontiguousarray(records[:, 0]), self.label_dtype),
+            self.to_layout(test_records[:, 1:].reshape(-1, 3, 32, 32)),
+            as_dtype(ascontiguousarray(test_records[:, 0]), self.label_dtype),
         )
 
+    def to_layout(self, images):
+        with self._phase("transform"):
+            return to_layout(
+                images, "NCHW", self.layout, self.max_workers, **self.transform
+            )
+
     def bytes_to_utf(self, data):
         if isinstance(data, bytes):
             return data.decode("utf-8")
@@ -83,54 +207,59 @@ class CIFAR10(Dataset):
 class CIFAR100(Dataset):
     def __init__(self, *args, **kwargs):
         kwargs["url"] = "https://www.cs.toronto.edu/~kriz/"
-        kwargs["filename"] = "cifar-100-python.tar.gz"
+        kwargs["format"] = check_format(kwargs.get("format", "python"))
+        kwargs["filename"] = "cifar-100-{}.tar.gz".format(kwargs["format"])
+        kwargs["checksums"] = kwargs.get(
+            "checksums",
+            {
+                "cifar-100-python.tar.gz": {
+                    "md5": "eb9058c3a382ffc7106e4002c42a8d85",
+                    "size": 169001437,
+                },
+                "cifar-100-binary.tar.gz": {
+                    "md5": "03b5dce01913d631647c71ecec9e9cb8",
+                    "size": 168513733,
+                },
+            },
+        )
         super(CIFAR100, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
+        self.format = kwargs["format"]
+        self.layout = check_layout(kwargs.get("layout", "NHWC"))
+        self.transform = check_transform(kwargs)
+        self.label_dtype = check_dtype(kwargs.get("label_dtype"))
         self.labels_type = kwargs.get("labels_type", "fine")
 
     def load(self):
-        self.download_file()
-        return self.__parse_file(self.target_filename)
+        parse_file = (
+            self.__parse_binary if self.format == "binary" else self.__parse_file
+        )
+        return self.load_cached(
+            parse_file,
+            self.target_filename,
+            attrs=("meta",),
+            labels_type=self.labels_type,
+            layout=self.layout,
+            label_dtype=self.label_dtype,
+            **self.transform
+        )
 
     def __parse_file(self, filename):
-        dir_name = os.path.dirname(filename)
-        x_train = array([])
-        y_train = array([])
-        x_test = array([])
-        y_test = array([])
-
-        with tarfile.open(filename) as f_in:
-            datasets = [f for f in f_in.getnames() if "train" in f or "test" in f]
-
-            for dataset in datasets:
-                dataset_full_path = os.path.join(dir_name, dataset)
-
-                if not os.path.isfile(dataset_full_path):
-                    f_in.extract(dataset, path=dir_name)
-
-                with open(dataset_full_path, "rb") as f:
-                    temp = pickle.load(f, encoding="bytes")
-                    temp = self.bytes_to_utf(temp)
-                    x_temp = temp["data"]
-                    y_temp = array(temp[self.labels_type + "_labels"]).reshape(-1, 1)
-
-                    if "test" not in dataset:
-                        x_train = vstack([x_train, x_temp]) if x_train.size else x_temp
-                        y_train = vstack([y_train, y_temp]) if y_train.size else y_temp
-
-                    else:
-                        x_test = x_temp
-                        y_test = y_temp
-
-            meta = [f for f in f_in.getnames() if "meta" in f][0]
-            meta_full_path = os.path.join(dir_name, meta)
-
-            if not os.path.isfile(meta_full_path):
-                f_in.extract(meta, path=dir_name)
-
-            with open(meta_full_path, "rb") as f:
-                self.meta = pickle.load(f, encoding="bytes")
+        output_ = dict()
+
+        for name, _, f in iter_tar(filename):
+            if name in ["train", "test"]:
+                with self._phase("unpickle"):
+                    batch = pickle.load(f, encoding="bytes")
+                output_["x_" + name] = asarray(batch[b"data"], dtype=uint8)
+                output_["y_" + name] = array(
+                    batch[(self.labels_type + "_labels").encode("utf-8")],
+                    dtype=self.label_dtype or int64,
+                )
+
+            elif name == "meta":
+                with self._phase("unpickle"):
+                    self.meta = pickle.load(f, encoding="bytes")
                 self.meta = self.bytes_to_utf(self.meta)
                 self.meta["coarse_label_names"] = [
                     x.decode("utf-8") for x in self.meta["coarse_label_names"]
@@ -139,15 +268,45 @@ class CIFAR100(Dataset):
                     x.decode("utf-8") for x in self.meta["fine_label_names"]
                 ]
 
-        # if self.labels_type == "coarse":
+        return (
+            self.to_layout(output_["x_train"].reshape(-1, 3, 32, 32)),
+            output_["y_train"],
+            self.to_layout(output_["x_test"].reshape(-1, 3, 32, 32)),
+            output_["y_test"],
+        )
+
+    def __parse_binary(self, filename):
+        output_ = dict()
+        self.meta = dict()
+        label = 0 if self.labels_type == "coarse" else 1
+
+        for name, size, f in iter_tar(filename):
+            if name in ["train.bin", "test.bin"]:
+                with self._phase("extract"):
+                    records = read_records(f, size, 3074)
+                output_["x_" + name[:-4]] = self.to_layout(
+                    records[:, 2:].reshape(-1, 3, 32, 32)
+                )
+                output_["y_" + name[:-4]] = as_dtype(
+                    ascontiguousarray(records[:, label]), self.label_dtype
+                )
+
+            elif name in ["coarse_label_names.txt", "fine_label_names.txt"]:
+                self.meta[name[:-4]] = read_names(f)
 
         return (
-            x_train.reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1),
-            y_train.reshape(-1),
-            x_test.reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1),
-            y_test.reshape(-1),
+            output_["x_train"],
+            output_["y_train"],
+            output_["x_test"],
+            output_["y_test"],
         )
 
+    def to_layout(self, images):
+        with self._phase("transform"):
+            return to_layout(
+                images, "NCHW", self.layout, self.max_workers, **self.transform
+            )
+
     def bytes_to_utf(self, data):
         if isinstance(data, bytes):
             return data.decode("utf-8")
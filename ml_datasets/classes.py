@@ -0,0 +1,184 @@
+import numpy as np
+
+
+class ClassIndex:
+    """
+    Rows of every class of a label array, built once with a stable argsort.
+
+    Stored CSR-style: the rows of `classes[i]` are `indices[offsets[i]:offsets[i + 1]]`,
+    so looking up a class is a slice instead of a scan of the labels.
+
+    Arguments:
+        classes: sorted label values present in the labels
+        offsets: `len(classes) + 1` start offsets into `indices`
+        indices: row numbers grouped by class
+    """
+
+    def __init__(self, classes, offsets, indices):
+        self.classes = classes
+        self.offsets = offsets
+        self.indices = indices
+
+    @classmethod
+    def from_labels(cls, labels):
+        """
+        Arguments:
+            labels: 1-D array of class labels
+
+        Returns:
+            `ClassIndex` of `labels`
+        """
+        labels = np.asarray(labels)
+        if labels.ndim != 1:
+            raise ValueError(
+                "class labels must be 1-D, got shape {}".format(labels.shape)
+            )
+
+        # radix sort for the small integer dtypes, stable for all of them
+        indices = np.argsort(labels, kind="stable")
+        sorted_labels = labels[indices]
+        starts = np.flatnonzero(sorted_labels[1:] != sorted_labels[:-1]) + 1
+        offsets = np.concatenate([[0], starts, [len(labels)]] if len(labels) else [[0]])
+
+        return cls(sorted_labels[offsets[:-1]], offsets.astype(np.int64), indices)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __contains__(self, label):
+        return self._position(label) is not None
+
+    def __repr__(self):
+        return "ClassIndex({} classes, {} rows)".format(len(self), len(self.indices))
+
+    @property
+    def counts(self):
+        """Number of rows of every class, in the order of `classes`."""
+        return np.diff(self.offsets)
+
+    def rows(self, label):
+        """
+        Returns:
+            Rows of `label` in their original order (empty if it does not occur)
+        """
+        i = self._position(label)
+        if i is None:
+            return self.indices[:0]
+
+        return self.indices[self.offsets[i] : self.offsets[i + 1]]
+
+    def sample(self, k, seed=None, classes=None):
+        """
+        Draw up to `k` rows of every class without replacement.
+
+        Arguments:
+            k: number of rows per class (all the rows of a smaller class)
+            seed: seed of the draws (None for fresh ones)
+            classes: optional label values to sample from (default: all)
+
+        Returns:
+            Sorted numpy array of row numbers
+        """
+        rng = np.random.default_rng(seed)
+        labels = self.classes if classes is None else classes
+        rows = [self.rows(label) for label in labels]
+
+        return self._gather(
+            rng.choice(r, min(k, len(r)), replace=False) for r in rows if len(r)
+        )
+
+    def stratified(self, size, seed=None):
+        """
+        Draw a subsample that keeps the class proportions.
+
+        Every class gets its proportional share of `size` rounded down, and the rows
+        left over go to the classes with the largest remainders.
+
+        Arguments:
+            size: number of rows, or a float in (0, 1] for a fraction of them
+            seed: seed of the draws (None for fresh ones)
+
+        Returns:
+            Sorted numpy array of row numbers
+        """
+        counts = self.counts
+        total = int(counts.sum())
+
+        if isinstance(size, (float, np.floating)):
+            if not 0 < size <= 1:
+                raise ValueError("fraction must be in (0, 1], got {}".format(size))
+            size = int(round(size * total))
+
+        if not 0 <= size <= total:
+            raise ValueError("size must be in [0, {}], got {}".format(total, size))
+
+        exact = counts * (size / total) if total else counts * 0.0
+        quota = np.floor(exact).astype(np.int64)
+        left = size - int(quota.sum())
+        quota[np.argsort(quota - exact, kind="stable")[:left]] += 1
+
+        rng = np.random.default_rng(seed)
+
+        return self._gather(
+            rng.choice(self.rows(label), k, replace=False)
+            for label, k in zip(self.classes, quota)
+            if k
+        )
+
+    def balanced_batches(self, batch_size, num_batches=None, seed=None, classes=None):
+        """
+        Generate batches with the same number of rows of every class.
+
+        Each class contributes `batch_size // len(classes)` rows per batch, the
+        remainder rotating over the classes; small classes are reshuffled and reused.
+
+        Arguments:
+            batch_size: number of rows per batch
+            num_batches: number of batches (default: one epoch's worth of rows)
+            seed: seed of the permutations (None for fresh ones)
+            classes: optional label values to sample from (default: all)
+
+        Yields:
+            Sorted numpy arrays of row numbers
+        """
+        rng = np.random.default_rng(seed)
+        labels = self.classes if classes is None else classes
+        rows = [r for r in (self.rows(label) for label in labels) if len(r)]
+        if not rows:
+            raise ValueError("no rows to sample balanced batches from")
+
+        if num_batches is None:
+            num_batches = sum(len(r) for r in rows) // batch_size
+
+        n = len(rows)
+        quota = np.full((num_batches, n), batch_size // n, dtype=np.int64)
+        extra = batch_size % n
+        if extra:
+            batches = np.arange(num_batches)[:, None]
+            quota[batches, (batches * extra + np.arange(extra)) % n] += 1
+
+        ends = np.cumsum(quota, axis=0)
+        starts = ends - quota
+
+        streams = []
+        for j, r in enumerate(rows):
+            need = int(ends[-1, j]) if num_batches else 0
+            streams.append(
+                np.concatenate(
+                    [rng.permutation(r) for _ in range(-(-need // len(r)))] or [r[:0]]
+                )
+            )
+
+        for b in range(num_batches):
+            yield self._gather(streams[j][starts[b, j] : ends[b, j]] for j in range(n))
+
+    def _position(self, label):
+        i = int(np.searchsorted(self.classes, label))
+        if i < len(self.classes) and self.classes[i] == label:
+            return i
+
+        return None
+
+    def _gather(self, rows):
+        rows = list(rows)
+        return np.sort(np.concatenate(rows)) if rows else self.indices[:0]
@@ -1,11 +1,69 @@
+import functools
+import glob
 import tempfile
-import requests
-import sys
+import threading
+import hashlib
+import json
 import os
-from tqdm import tqdm
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from ml_datasets.stats import NO_PHASE, measure
+
+MIN_SEGMENT_SIZE = 1 << 20
+MAX_CHUNK_SIZE = 1 << 22
+PROGRESS_STEP = 1 << 20
+# part of every cache key: bump it when a parser or the cache format changes, so
+# entries written by the old code are not reused
+CACHE_VERSION = 2
+# sizes, Range offsets and hashes refer to the bytes on the server, so the body
+# must not be content-encoded (requests asks for gzip by default)
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+class DownloadError(IOError):
+    pass
+
+
+class RangeNotSupported(DownloadError):
+    pass
+
+
+def offline_default():
+    return os.environ.get("ML_DATASETS_OFFLINE", "").lower() in ["1", "true", "yes"]
+
+
+def _measured(load):
+    @functools.wraps(load)
+    def wrapper(self):
+        # a load() nested in a measured one (or with the stats off) runs as is
+        if self._stats is not None or not (
+            self.stats or self.stats_callback is not None
+        ):
+            return load(self)
+
+        try:
+            output, stats = measure(
+                functools.partial(load, self), self, self.trace_memory
+            )
+        except BaseException as e:
+            stats = getattr(e, "load_stats", None)
+            if stats is not None:
+                self._report(stats)
+            raise
+
+        self._report(stats)
+        return output
+
+    return wrapper
 
 
 class Dataset:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "load" in cls.__dict__:
+            cls.load = _measured(cls.__dict__["load"])
+
     def __init__(self, *args, **kwargs):
         self.filename = kwargs.get("filename", None)
         self.url = kwargs.get("url", None)
@@ -24,45 +82,903 @@ class Dataset:
             self.target_filename = os.path.join(self.target_dir, self.filename)
 
         self.force = kwargs.get("force", False)
-        self.chunk_size = kwargs.get("chunk_size", 1024)
+        self.chunk_size = kwargs.get("chunk_size", 1 << 16)
         self.verbose = kwargs.get("verbose", True)
+        self.cache = kwargs.get("cache", True)
+        self.mmap_mode = kwargs.get("mmap_mode", "r")
+        self.max_workers = kwargs.get("max_workers", 4)
+        self.segments = kwargs.get("segments", 1)
+        self.checksums = kwargs.get("checksums", None) or {}
+        self.verify = kwargs.get("verify", True)
+        self.offline = kwargs.get("offline", None)
+        self.offline = offline_default() if self.offline is None else self.offline
+        self._session = None
+        self.split = kwargs.get("split", "train")
+        self._lock = threading.Lock()
+        self._splits = None
+        self._attrs = ()
+        self._shared = None
+        self._class_index = {}
+        self._cache_prefix = None
+        self.stats = kwargs.get("stats", False)
+        self.stats_callback = kwargs.get("stats_callback", None)
+        self.trace_memory = kwargs.get("trace_memory", False)
+        self.last_load_stats = None
+        self._stats = None
+
+    def __len__(self):
+        return len(self.get_split(self.split)[1])
+
+    def __getitem__(self, index):
+        x, y = self.get_split(self.split)
+        return x[index], y[index]
+
+    def get_split(self, split="train"):
+        """
+        Arrays of one split, loaded on first use and kept for later calls.
+
+        Arguments:
+            split: "train" or "test" (the splits returned by `load()`)
+
+        Returns:
+            Tuple of numpy arrays: `(x, y)`
+        """
+        if self._splits is None:
+            self._splits = self._split_output(self.load())
+
+        if self._splits.get(split, (None, None))[1] is None:
+            loaded = [k for k, v in self._splits.items() if v[1] is not None]
+            raise ValueError(
+                "split {!r} was not loaded (loaded: {})".format(
+                    split, ", ".join(loaded) or "none"
+                )
+            )
+
+        return self._splits[split]
+
+    def publish_shared(self, name):
+        """
+        Load the dataset once and publish its arrays in shared memory, so that other
+        processes on the machine can `attach_shared(name)` instead of holding their own
+        copy.
+
+        Arguments:
+            name: name of the dataset in shared memory (unique on the machine)
+
+        Returns:
+            `ml_datasets.shared.SharedArrays`; `.arrays` is the output of `load()` and
+                `.release()` drops this process' reference (also dropped when the
+                dataset is garbage collected)
+        """
+        from ml_datasets.shared import publish
+
+        output = self.load()
+        shared = publish(
+            name, output, {attr: getattr(self, attr) for attr in self._attrs}
+        )
+        self._splits = self._split_output(shared.arrays)
+        self._shared = shared
+
+        return shared
+
+    def attach_shared(self, name):
+        """
+        Map the arrays published by `publish_shared(name)` in another process, without
+        parsing or copying them. `get_split`, indexing and `iter_batches` then use the
+        shared arrays.
+
+        Returns:
+            `ml_datasets.shared.SharedArrays`; call `.release()` when done
+        """
+        from ml_datasets.shared import attach
+
+        shared = attach(name)
+        for attr, value in shared.attrs.items():
+            setattr(self, attr, value)
+        self._splits = self._split_output(shared.arrays)
+        self._shared = shared
+
+        return shared
+
+    def export_shards(self, directory, **kwargs):
+        """
+        Write the splits as fixed-size, memory-mappable shards, so that datasets larger
+        than memory are read with `ml_datasets.shards.ShardReader`.
+
+        Arguments:
+            directory: output directory
+            kwargs: options of `ml_datasets.shards.export_shards` (splits, shard_bytes,
+                batch_size, transform)
+
+        Returns:
+            Path of the index file
+        """
+        from ml_datasets.shards import export_shards
+
+        return export_shards(self, directory, **kwargs)
+
+    def _report(self, stats):
+        self.last_load_stats = stats
+        if self.stats_callback is not None:
+            self.stats_callback(stats)
+
+    def _phase(self, name):
+        """
+        Context manager timing the `name` phase of the load being measured (a shared
+        no-op while the stats are off).
+        """
+        return NO_PHASE if self._stats is None else self._stats.phase(name)
+
+    def _count(self, counter, n):
+        if self._stats is not None:
+            self._stats.add(counter, n)
+
+    def _split_output(self, output):
+        x_train, y_train, x_test, y_test = output
+        return {"train": (x_train, y_train), "test": (x_test, y_test)}
+
+    def iter_batches(
+        self,
+        split="train",
+        batch_size=32,
+        shuffle=False,
+        seed=None,
+        drop_last=False,
+        reuse_buffer=False,
+        balanced=False,
+    ):
+        """
+        Iterate over minibatches of one split.
+
+        Without shuffling the batches are slices of the arrays. With shuffling they are
+        gathered from a permutation, sorted within each batch to keep reads sequential.
+
+        Arguments:
+            split: "train" or "test"
+            batch_size: number of samples per batch
+            shuffle: True to visit the samples in random order
+            seed: seed of the permutation (None for a fresh one on every call)
+            drop_last: True to skip the final batch if it is smaller than `batch_size`
+            reuse_buffer: True to copy every batch into the same preallocated arrays, so
+                steady-state iteration allocates nothing; a batch is then only valid
+                until the next one is requested
+            balanced: True to draw every batch with the same number of samples of each
+                class (see `ClassIndex.balanced_batches`), ignoring `shuffle` and
+                `drop_last`
+
+        Yields:
+            Tuple of numpy arrays: `(x_batch, y_batch)`
+        """
+        x, y = self.get_split(split)
+        n = len(y)
+        stop = n - n % batch_size if drop_last else n
+
+        if balanced:
+            batches = self.class_index(split).balanced_batches(batch_size, seed=seed)
+
+        elif shuffle:
+            order = np.random.default_rng(seed).permutation(n)
+            batches = (
+                np.sort(order[start : start + batch_size])
+                for start in range(0, stop, batch_size)
+            )
+
+        else:
+            batches = (
+                slice(start, min(start + batch_size, n))
+                for start in range(0, stop, batch_size)
+            )
+
+        if reuse_buffer:
+            x_out = np.empty((batch_size,) + x.shape[1:], dtype=x.dtype)
+            y_out = np.empty((batch_size,) + y.shape[1:], dtype=y.dtype)
+
+        for index in batches:
+            if isinstance(index, slice):
+                if reuse_buffer:
+                    k = index.stop - index.start
+                    x_out[:k] = x[index]
+                    y_out[:k] = y[index]
+                    yield x_out[:k], y_out[:k]
+
+                else:
+                    yield x[index], y[index]
+
+            elif reuse_buffer:
+                k = len(index)
+                np.take(x, index, axis=0, out=x_out[:k])
+                np.take(y, index, axis=0, out=y_out[:k])
+                yield x_out[:k], y_out[:k]
+
+            else:
+                yield np.take(x, index, axis=0), np.take(y, index, axis=0)
+
+    def class_index(self, split=None):
+        """
+        Rows of every class of one split, built on first use and kept for later calls.
+        With the cache enabled the index is saved next to the cached arrays, so it is
+        built once per cache entry.
+
+        Arguments:
+            split: "train" or "test" (default: the `split` of the dataset)
+
+        Returns:
+            `ml_datasets.classes.ClassIndex`
+        """
+        from ml_datasets.classes import ClassIndex
+
+        split = split or self.split
+        if split not in self._class_index:
+            y = self.get_split(split)[1]
+            prefix = self._cache_prefix
+            names = ["classes", "offsets", "indices"]
+            filenames = ["{}.{}.index-{}.npy".format(prefix, split, k) for k in names]
+
+            if prefix is not None and all(os.path.isfile(f) for f in filenames):
+                index = ClassIndex(*[self._load_array(f) for f in filenames])
+
+            else:
+                index = ClassIndex.from_labels(y)
+                if prefix is not None:
+                    for filename, array_ in zip(
+                        filenames, [index.classes, index.offsets, index.indices]
+                    ):
+                        self._save_array(filename, array_)
+
+            self._class_index[split] = index
+
+        return self._class_index[split]
+
+    def stratified_sample(self, size, split=None, seed=None):
+        """
+        Subsample one split keeping its class proportions.
+
+        Arguments:
+            size: number of samples, or a float in (0, 1] for a fraction of them
+            split: "train" or "test" (default: the `split` of the dataset)
+            seed: seed of the draws (None for fresh ones)
+
+        Returns:
+            Tuple of numpy arrays: `(x, y)`, in the order of the split
+        """
+        split = split or self.split
+        x, y = self.get_split(split)
+        index = self.class_index(split).stratified(size, seed)
+
+        return np.take(x, index, axis=0), np.take(y, index, axis=0)
+
+    @property
+    def session(self):
+        """
+        Keep-alive `requests.Session` shared by all downloads of this dataset, with a
+        connection pool large enough for `max_workers * segments` concurrent requests.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with self._lock:
+            if self._session is None:
+                pool_size = max(self.max_workers * self.segments, 10)
+                adapter = HTTPAdapter(pool_maxsize=pool_size)
+                self._session = requests.Session()
+                self._session.headers.update(IDENTITY)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+
+        return self._session
 
     def download_file(self):
+        with self._phase("download"):
+            self._download_files()
+
+    def _download_files(self):
         if isinstance(self.target_filename, list):
-            for i in range(len(self.target_filename)):
-                self._download_file(self.filename[i], self.target_filename[i])
+            files = list(zip(self.filename, self.target_filename))
 
         else:
-            self._download_file(self.filename, self.target_filename)
+            files = [(self.filename, self.target_filename)]
 
-    def _download_file(self, filename, target_filename):
-        if self.force or not os.path.isfile(target_filename):
-            url = requests.compat.urljoin(self.url, filename)
+        if len(files) == 1 or self.max_workers <= 1:
+            for filename, target_filename in files:
+                self._download_file(filename, target_filename)
 
-            if self.verbose:
-                print("from {} to {}".format(url, target_filename))
+            return
+
+        missing = [f for f in files if self.force or not os.path.isfile(f[1])]
+
+        from tqdm import tqdm
+
+        # one progress bar for all files, its total grows as the responses arrive
+        with tqdm(total=0, unit="iB", unit_scale=True, disable=not missing) as pbar:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._download_file, filename, target_filename, pbar
+                    )
+                    for filename, target_filename in files
+                ]
+
+                for future in futures:
+                    future.result()
+
+    def _download_file(self, filename, target_filename, pbar=None):
+        part_filename = target_filename + ".part"
+
+        if (self.offline or not self.force) and os.path.isfile(target_filename):
+            if self._check_local(filename, target_filename):
+                if self.verbose:
+                    print(
+                        "{} available locally, skip downloading".format(target_filename)
+                    )
+
+                return
+
+            if self.offline:
+                raise DownloadError(
+                    "{} failed verification and offline mode is enabled".format(
+                        target_filename
+                    )
+                )
 
-            r = self.check_url(url, target_dir=self.target_dir)
+            # keep the bytes of a truncated file, the download resumes from them;
+            # a file of the full size is corrupted and downloaded again
+            expected = self.checksums.get(filename, {}).get("size")
+            if expected is not None and os.path.getsize(target_filename) >= expected:
+                os.remove(target_filename)
+                self._remove_marker(target_filename)
+            else:
+                os.replace(target_filename, part_filename)
+
+        if self.offline:
+            raise DownloadError(
+                "{} is not available locally and offline mode is enabled".format(
+                    target_filename
+                )
+            )
+
+        url = urljoin(self.url, filename)
+
+        if self.verbose:
+            print("from {} to {}".format(url, target_filename))
+
+        if self.force:
+            self._remove_part(part_filename)
+            self._remove_marker(target_filename)
+
+        own_pbar = None
+        hashes = self._new_hashes(filename)
+
+        journal = self._read_journal(part_filename)
+        if journal is not None:
+            total_size, ranges = journal
+            own_pbar, journal_pbar = self._start_progress(pbar, total_size)
+            self._update_progress(journal_pbar, total_size - self._remaining(ranges))
+            try:
+                self._download_segmented(
+                    url, part_filename, total_size, ranges, journal_pbar
+                )
+                self._hash_file(part_filename, hashes)
+            except RangeNotSupported:
+                # the server stopped honouring ranges: start over with a stream
+                self._remove_part(part_filename)
+                if own_pbar is not None:
+                    own_pbar.close()
+                    own_pbar = None
+                journal = None
+
+        if journal is None:
+            self._download_stream(url, part_filename, pbar, hashes)
+
+        self._verify(filename, part_filename, hashes)
+        os.replace(part_filename, target_filename)
+        self._write_marker(target_filename, hashes)
+
+        if own_pbar is not None:
+            own_pbar.close()
+
+    def _download_stream(self, url, part_filename, pbar, hashes):
+        """
+        Download `url` into `part_filename`, resuming from its current size with an HTTP
+        Range request if it already exists.
+
+        `hashes` are updated with every chunk as it is written, so a streamed download
+        is verified without reading the file again.
+        """
+        offset = os.path.getsize(part_filename) if os.path.isfile(part_filename) else 0
+        probe = not offset and self.segments > 1 and hasattr(os, "pwrite")
+        if probe:
+            # one byte tells whether the server honours ranges and the size of the
+            # file, without starting a transfer of all of it
+            headers = {"Range": "bytes=0-0"}
+        else:
+            headers = {"Range": "bytes={}-".format(offset)} if offset else None
+
+        with self._phase("check_url"):
+            r = self.check_url(url, session=self.session, headers=headers)
+
+        if r.status_code == 416 and offset:
+            # the .part file is not shorter than the file on the server, so it
+            # cannot be resumed: start over
+            r.close()
+            self._remove_part(part_filename)
+            return self._download_stream(url, part_filename, pbar, hashes)
+
+        ranges = None
+        if probe and r.status_code in [206, 416]:
+            total = r.headers.get("content-range", "").rpartition("/")[2]
+            total_size = int(total) if total.isdigit() else 0
+            # reading the byte lets the connection go back to the session's pool
+            r.content
+            r.close()
+
+            if self._can_segment(total_size):
+                ranges = [
+                    [
+                        total_size * i // self.segments,
+                        total_size * (i + 1) // self.segments,
+                    ]
+                    for i in range(self.segments)
+                ]
+                r = None
+            else:
+                r = self.check_url(url, session=self.session)
+
+        if r is not None:
+            if r.status_code != 206:
+                offset = 0
 
             total_size = int(r.headers.get("content-length", 0))
-            pbar = tqdm(total=total_size, unit="iB", unit_scale=True)
-            with open(target_filename, "wb") as f:
+            total_size = total_size + offset if total_size else 0
+
+        own_pbar, pbar = self._start_progress(pbar, total_size)
+        self._update_progress(pbar, offset)
+
+        if ranges is not None:
+            try:
+                self._download_segmented(url, part_filename, total_size, ranges, pbar)
+                # ranges arrive out of order, so the file is hashed once at the end
+                self._hash_file(part_filename, hashes)
+            except RangeNotSupported:
+                # the server honoured the probe but answers the ranges with the
+                # whole file
+                self._remove_part(part_filename)
+                r = self.check_url(url, session=self.session)
+
+        if r is not None:
+            if offset:
+                self._hash_file(part_filename, hashes)
+
+            with open(part_filename, "ab" if offset else "wb") as f:
+                pending = 0
                 for chunk in r.iter_content(chunk_size=self.chunk_size):
                     if chunk:
-                        pbar.update(self.chunk_size)
                         f.write(chunk)
-            pbar.close()
+                        for hash_ in hashes.values():
+                            hash_.update(chunk)
 
-        else:
+                        pending += len(chunk)
+                        if pending >= PROGRESS_STEP:
+                            self._update_progress(pbar, pending)
+                            pending = 0
+
+                self._update_progress(pbar, pending)
+                size = f.tell()
+
+            self._count("bytes_downloaded", size - offset)
+
+            if total_size and size != total_size:
+                raise DownloadError(
+                    "incomplete download of {}: got {} of {} bytes, "
+                    "run again to resume".format(url, size, total_size)
+                )
+
+        if own_pbar is not None:
+            own_pbar.close()
+
+    def _start_progress(self, pbar, total_size):
+        if pbar is None:
+            from tqdm import tqdm
+
+            pbar = tqdm(total=total_size, unit="iB", unit_scale=True)
+            return pbar, pbar
+
+        with self._lock:
+            pbar.total += total_size
+            pbar.refresh()
+
+        return None, pbar
+
+    def _can_segment(self, total_size):
+        return total_size >= self.segments * MIN_SEGMENT_SIZE
+
+    def _download_segmented(self, url, part_filename, total_size, ranges, pbar):
+        """
+        Download the `[offset, end)` byte `ranges` of `url` in parallel, each written
+        with `os.pwrite` at its own offset of a preallocated `part_filename`.
+
+        The offsets reached so far are kept in a `<part_filename>.json` journal so an
+        interrupted download resumes where every range stopped.
+        """
+        fd = os.open(part_filename, os.O_RDWR | os.O_CREAT, 0o666)
+
+        try:
+            os.ftruncate(fd, total_size)
+            self._write_journal(part_filename, total_size, ranges)
+
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(
+                        self._download_range,
+                        url,
+                        fd,
+                        range_,
+                        part_filename,
+                        total_size,
+                        ranges,
+                        pbar,
+                    )
+                    for range_ in ranges
+                    if range_[0] < range_[1]
+                ]
+
+                for future in futures:
+                    future.result()
+
+        finally:
+            os.close(fd)
+
+        os.remove(part_filename + ".json")
+
+    def _download_range(self, url, fd, range_, part_filename, total_size, ranges, pbar):
+        start, end = range_
+        r = self.session.get(
+            url,
+            headers=dict(IDENTITY, Range="bytes={}-{}".format(start, end - 1)),
+            stream=True,
+        )
+        if r.status_code != 206:
+            r.close()
+            raise RangeNotSupported(
+                "{} does not support range requests ({})".format(url, r.status_code)
+            )
+
+        # large chunks for large segments, bounded to keep the buffers small
+        chunk_size = min(max(self.chunk_size, (end - start) // 64), MAX_CHUNK_SIZE)
+        pending = 0
+
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            view = memoryview(chunk)
+            while view:
+                written = os.pwrite(fd, view, range_[0])
+                view = view[written:]
+                range_[0] += written
+                pending += written
+
+            if pending >= PROGRESS_STEP:
+                self._update_progress(pbar, pending)
+                self._write_journal(part_filename, total_size, ranges)
+                pending = 0
+
+        self._update_progress(pbar, pending)
+        self._write_journal(part_filename, total_size, ranges)
+        self._count("bytes_downloaded", range_[0] - start)
+
+        if range_[0] != end:
+            raise DownloadError(
+                "incomplete range {}-{} of {}: got {} bytes, run again to resume".format(
+                    start, end - 1, url, range_[0] - start
+                )
+            )
+
+    def _write_journal(self, part_filename, total_size, ranges):
+        with self._lock:
+            with open(part_filename + ".json.tmp", "w") as f:
+                json.dump({"size": total_size, "ranges": ranges}, f)
+            os.replace(part_filename + ".json.tmp", part_filename + ".json")
+
+    @staticmethod
+    def _read_journal(part_filename):
+        if not os.path.isfile(part_filename + ".json"):
+            return None
+
+        if not os.path.isfile(part_filename):
+            os.remove(part_filename + ".json")
+            return None
+
+        with open(part_filename + ".json", "r") as f:
+            journal = json.load(f)
+
+        return journal["size"], journal["ranges"]
+
+    @staticmethod
+    def _remaining(ranges):
+        return sum(end - offset for offset, end in ranges)
+
+    @staticmethod
+    def _remove_part(part_filename):
+        for filename in [part_filename, part_filename + ".json"]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def _new_hashes(self, filename):
+        if not self.verify:
+            return {}
+
+        algorithms = ["sha256"] + [
+            k for k in self.checksums.get(filename, {}) if k not in ["sha256", "size"]
+        ]
+
+        return {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+
+    def _hash_file(self, filename, hashes):
+        if hashes:
+            with self._phase("verify"), open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+                    for hash_ in hashes.values():
+                        hash_.update(chunk)
+
+                self._count("bytes_read", f.tell())
+
+        return hashes
+
+    def _verify(self, filename, target_filename, hashes):
+        """
+        Compare the size and `hashes` of `target_filename` with the checksum manifest
+        entry of `filename`, removing the file if they differ.
+        """
+        mismatch = self._mismatch(filename, target_filename, hashes)
+        if mismatch:
+            os.remove(target_filename)
+            raise DownloadError(
+                "{} failed verification ({} mismatch), download it again".format(
+                    filename, ", ".join(mismatch)
+                )
+            )
+
+    def _mismatch(self, filename, target_filename, hashes):
+        expected = self.checksums.get(filename) if self.verify else None
+        if not expected:
+            return []
+
+        actual = {k: v.hexdigest() for k, v in hashes.items()}
+        actual["size"] = os.path.getsize(target_filename)
+
+        return [k for k in expected if expected[k] != actual.get(k)]
+
+    def _check_local(self, filename, target_filename):
+        """
+        Decide whether an existing `target_filename` can be used as is.
+
+        A verified-marker whose size and mtime match the file is trusted with a single
+        `stat()`; a file without one is hashed once if the manifest has an entry for it.
+        """
+        if not self.verify or filename not in self.checksums:
+            return True
+
+        if self._read_marker(target_filename):
+            return True
+
+        hashes = self._hash_file(target_filename, self._new_hashes(filename))
+        if self._mismatch(filename, target_filename, hashes):
             if self.verbose:
-                print("{} available locally, skip downloading".format(target_filename))
+                print("{} failed verification".format(target_filename))
+
+            return False
+
+        self._write_marker(target_filename, hashes)
+        return True
 
     @staticmethod
-    def check_url(url, target_dir=None):
-        r = requests.get(url, target_dir, stream=True)
-        if r.status_code != 200:
-            print("{} not available".format(url))
-            sys.exit()
+    def _read_marker(target_filename):
+        if not os.path.isfile(target_filename + ".verified"):
+            return None
+
+        # a marker that cannot be read (e.g. truncated by a crash) only means that
+        # the file is verified again
+        try:
+            stat = os.stat(target_filename)
+            with open(target_filename + ".verified", "r") as f:
+                marker = json.load(f)
+
+            if marker["size"] != stat.st_size or marker["mtime_ns"] != stat.st_mtime_ns:
+                return None
+
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        return marker
+
+    @staticmethod
+    def _write_marker(target_filename, hashes):
+        if not hashes:
+            return
+
+        stat = os.stat(target_filename)
+        marker = {k: v.hexdigest() for k, v in hashes.items()}
+        marker.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+        with open(target_filename + ".verified.tmp", "w") as f:
+            json.dump(marker, f)
+        os.replace(target_filename + ".verified.tmp", target_filename + ".verified")
+
+    @staticmethod
+    def _remove_marker(target_filename):
+        if os.path.isfile(target_filename + ".verified"):
+            os.remove(target_filename + ".verified")
+
+    def _update_progress(self, pbar, n):
+        if n:
+            with self._lock:
+                pbar.update(n)
+
+    def load_cached(self, parse_file, filename, attrs=(), **options):
+        """
+        Return the output of `parse_file(filename)`, parsing the raw file only once.
+
+        The parsed arrays are written as `.npy` files in `target_dir` and reopened with
+        `np.load(mmap_mode=self.mmap_mode)` on later calls.
+
+        Arguments:
+            parse_file: callable that parses `filename` into a tuple of numpy arrays
+            filename: source file (or list of files) the arrays are parsed from
+            attrs: names of instance attributes set by `parse_file` (e.g. "meta") that
+                are restored on a cache hit
+            options: parser options that change the output (e.g. rotate=True)
+
+        Returns:
+            Tuple of numpy arrays (None entries of the parsed output are kept)
+        """
+        self._attrs = attrs
+
+        self._cache_prefix = None
+
+        if not self.cache:
+            if self._stats is not None:
+                self._stats.cache = "disabled"
+            self.download_file()
+            return self._parse(parse_file, filename)
+
+        prefix = os.path.join(self.target_dir, self.cache_key(filename, **options))
+        self._cache_prefix = prefix
+        hit = not self.force and self._is_cached(prefix, filename)
+        if self._stats is not None:
+            self._stats.cache = "hit" if hit else "miss"
+
+        if not hit:
+            self.download_file()
+            output = self._parse(parse_file, filename)
+            with self._phase("cache_write"):
+                self._write_cache(prefix, output, attrs, self._sources(filename))
+
+        elif self.verbose:
+            print("{}.json available locally, skip parsing".format(prefix))
+
+        with self._phase("cache_read"):
+            return self._read_cache(prefix)
+
+    def _parse(self, parse_file, filename):
+        with self._phase("parse"):
+            output = parse_file(filename)
+
+        self._count("bytes_read", sum(source[1] for source in self._sources(filename)))
+        return output
+
+    def cache_key(self, filename, **options):
+        filenames = filename if isinstance(filename, list) else [filename]
+        filenames = [os.path.basename(file_) for file_ in filenames]
+
+        key = repr(
+            (CACHE_VERSION, self.__class__.__name__, filenames, sorted(options.items()))
+        )
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+        return "{}-{}".format(self.__class__.__name__.lower(), digest)
+
+    @staticmethod
+    def _sources(filename):
+        filenames = filename if isinstance(filename, list) else [filename]
+        sources = []
+        for file_ in filenames:
+            if os.path.isfile(file_):
+                stat = os.stat(file_)
+                sources.append([file_, stat.st_size, stat.st_mtime_ns])
+
+        return sources
+
+    def _is_cached(self, prefix, filename):
+        """
+        A cache entry is valid if every source file it was parsed from is either
+        unchanged or no longer on disk, so the raw archives can be deleted (or never
+        fetched on an offline node) once the arrays are cached.
+        """
+        if not os.path.isfile(prefix + ".json"):
+            return False
+
+        with open(prefix + ".json", "r") as f:
+            sources = json.load(f).get("sources", [])
+
+        current = {source[0]: source for source in self._sources(filename)}
+
+        return all(current.get(source[0], source) == source for source in sources)
+
+    def _write_cache(self, prefix, output, attrs, sources):
+        # class indices built from the arrays being replaced
+        for filename in glob.glob(glob.escape(prefix) + ".*.index-*.npy"):
+            os.remove(filename)
+
+        meta = {
+            "outputs": len(output),
+            "missing": [i for i, array_ in enumerate(output) if array_ is None],
+            "arrays": [],
+            "attrs": {},
+            "sources": sources,
+        }
+
+        for i, array_ in enumerate(output):
+            if array_ is not None:
+                self._save_array("{}.{}.npy".format(prefix, i), array_)
+
+        for attr in attrs:
+            value = getattr(self, attr)
+            if isinstance(value, np.ndarray):
+                self._save_array("{}.{}.npy".format(prefix, attr), value)
+                meta["arrays"].append(attr)
+            else:
+                meta["attrs"][attr] = value
+
+        # the manifest is written last so an interrupted write is never picked up
+        with open(prefix + ".json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(prefix + ".json.tmp", prefix + ".json")
+
+    def _read_cache(self, prefix):
+        with open(prefix + ".json", "r") as f:
+            meta = json.load(f)
+
+        for attr, value in meta["attrs"].items():
+            setattr(self, attr, value)
+
+        for attr in meta["arrays"]:
+            setattr(self, attr, self._load_array("{}.{}.npy".format(prefix, attr)))
+
+        missing = set(meta.get("missing", []))
+
+        return tuple(
+            None if i in missing else self._load_array("{}.{}.npy".format(prefix, i))
+            for i in range(meta["outputs"])
+        )
+
+    def _load_array(self, filename):
+        array_ = np.load(filename, mmap_mode=self.mmap_mode, allow_pickle=False)
+        if self.mmap_mode is None:
+            self._count("bytes_read", array_.nbytes)
+
+        return array_
+
+    def _save_array(self, filename, array_):
+        with open(filename + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(array_), allow_pickle=False)
+            self._count("bytes_written", f.tell())
+        os.replace(filename + ".tmp", filename)
+
+    @staticmethod
+    def check_url(url, session=None, headers=None):
+        import requests
+
+        ranged = headers is not None and "Range" in headers
+
+        try:
+            r = (session or requests).get(
+                url, headers=dict(IDENTITY, **(headers or {})), stream=True
+            )
+
+        except requests.RequestException as e:
+            raise DownloadError("{} not available ({})".format(url, e)) from e
+
+        # 206/416 are the answers to a Range request resuming a partial download
+        if r.status_code not in ([200, 206, 416] if ranged else [200]):
+            r.close()
+            raise DownloadError("{} not available ({})".format(url, r.status_code))
 
         else:
             return r
@@ -1,11 +1,9 @@
 import os
 import tempfile
 import warnings
-import pandas as pd
 import numpy as np
-import rdata
-import gzip
 from ml_datasets.dataset import Dataset
+from ml_datasets.text import parse_table, read_header, read_text
 
 warnings.filterwarnings("ignore")
 
@@ -21,21 +19,76 @@ class Mixture(Dataset):
 
         super(Mixture, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
         self.means = kwargs["means"]
+        self._component_means = None
 
     def load(self):
         if self.verbose:
             print("Retrieving ESL-Mixture dataset...")
 
-        self.download_file()
+        return self.load_cached(
+            self.__parse_file, self.target_filename, means=self.means
+        )
 
-        return self.__parse_file(self.target_filename)
+    def sample(self, n, seed=None, chunk_size=1 << 20, chunks=None):
+        """
+        Draw labeled points from the Gaussian mixture the dataset was simulated from, in
+        chunks of at most `chunk_size` points.
+
+        Every chunk has its own random stream derived from `seed`, so worker `r` of `k`
+        can generate its share with `chunks=range(r, num_chunks, k)`.
+
+        Arguments:
+            n: total number of points
+            seed: seed of the streams (None for fresh ones)
+            chunk_size: number of points per chunk
+            chunks: optional chunk numbers to generate (default: all, in order)
+
+        Yields:
+            Tuple of numpy arrays: `(x, y)`, float64 points of shape (k, 2) and their
+                int64 labels
+        """
+        if self._component_means is None:
+            # the means are cached as the output of `means=1`, without changing
+            # the cache entry of the dataset itself
+            state = self._cache_prefix, self._attrs
+            try:
+                output = self.load_cached(
+                    lambda filename: self.__parse_file(filename, means=1),
+                    self.target_filename,
+                    means=1,
+                )
+            finally:
+                self._cache_prefix, self._attrs = state
+
+            self._component_means = np.asarray(output[2])
+
+        means = self._component_means
+        per_class = len(means) // 2
+        entropy = np.random.SeedSequence(seed).entropy
+
+        if chunks is None:
+            chunks = range(-(-n // chunk_size))
+
+        for i in chunks:
+            k = min(chunk_size, n - i * chunk_size)
+            if k <= 0:
+                raise IndexError("chunk {} is past the end of the sample".format(i))
+
+            rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(i,)))
+            y = rng.integers(0, 2, k)
+            x = rng.standard_normal((k, 2))
+            x *= np.sqrt(1 / 5)
+            x += means[y * per_class + rng.integers(0, per_class, k)]
+
+            yield x, y
+
+    def __parse_file(self, target_filename, means=None):
+        import rdata
 
-    def __parse_file(self, target_filename):
         parsed = rdata.parser.parse_file(open(target_filename))
         converted = rdata.conversion.convert(parsed)
-        if self.means == 1:
+        if (self.means if means is None else means) == 1:
             return (
                 converted["ESL.mixture"]["x"],
                 converted["ESL.mixture"]["y"].astype(int),
@@ -48,6 +101,9 @@ class Mixture(Dataset):
                 converted["ESL.mixture"]["y"].astype(int),
             )
 
+    def _split_output(self, output):
+        return {"train": output[:2]}
+
 
 class ProstateCancer(Dataset):
     def __init__(self, *args, **kwargs):
@@ -60,21 +116,25 @@ class ProstateCancer(Dataset):
 
         super(ProstateCancer, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
-
     def load(self):
         if self.verbose:
             print("Retrieving ESL-Prostate_Cancer dataset...")
 
         self.download_file()
 
-        return self.__parse_file(self.target_filename)
+        return self._parse(self.__parse_file, self.target_filename)
 
     def __parse_file(self, target_filename):
-        df = pd.read_csv(target_filename[0], sep="\t").drop("Unnamed: 0", axis=1)
+        import pandas as pd
 
-        self.train_test = df["train"].values
-        df.drop("train", axis=1, inplace=True)
+        data = read_text(target_filename[0])
+        columns = read_header(data)
+        table = parse_table(data, skip_rows=1, replace={b"T": b"1", b"F": b"0"})
+
+        # first column holds the row numbers, last one the train/test flag
+        self.train_test = np.where(table[:, -1] == 1, "T", "F").astype(object)
+        df = pd.DataFrame(table[:, 1:-1], columns=columns[:-1])
+        df = df.astype({c: np.int64 for c in ["age", "svi", "gleason", "pgg45"]})
         self.meta = list(df.columns)
 
         with open(target_filename[1], "r") as f:
@@ -82,6 +142,9 @@ class ProstateCancer(Dataset):
 
         return df
 
+    def _split_output(self, output):
+        raise TypeError("ProstateCancer.load() returns a DataFrame, not sample arrays")
+
 
 class EmailSpam(Dataset):
     def __init__(self, *args, **kwargs):
@@ -94,18 +157,18 @@ class EmailSpam(Dataset):
 
         super(EmailSpam, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
-
     def load(self):
         if self.verbose:
             print("Retrieving ESL-Email_Spam dataset...")
 
         self.download_file()
 
-        return self.__parse_file(self.target_filename)
+        return self._parse(self.__parse_file, self.target_filename)
 
     def __parse_file(self, target_filename):
-        data = pd.read_csv(target_filename[0], sep=" ", header=None)
+        import pandas as pd
+
+        table = parse_table(read_text(target_filename[0]))
         with open(target_filename[1], "r") as f:
             self.info = f.read()
 
@@ -170,20 +233,24 @@ class EmailSpam(Dataset):
             "capital_run_length_total",
             "spam",
         ]
-        data.columns = columns
+        data = pd.DataFrame(table, columns=columns)
+        data = data.astype({c: np.int64 for c in columns[-3:]})
 
-        self.train_test = pd.read_csv(target_filename[2], sep=" ", header=None).values
+        self.train_test = parse_table(read_text(target_filename[2]), dtype=np.int64)
         idx_train = np.where(self.train_test == 0)[0]
         idx_test = np.where(self.train_test == 1)[0]
 
-        x_train = data[columns[:-1]].values[idx_train]
-        y_train = data[columns[-1]].values[idx_train]
+        x_train = table[idx_train, :-1]
+        y_train = table[idx_train, -1].astype(np.int64)
 
-        x_test = data[columns[:-1]].values[idx_test]
-        y_test = data[columns[-1]].values[idx_test]
+        x_test = table[idx_test, :-1]
+        y_test = table[idx_test, -1].astype(np.int64)
 
         return data, x_train, y_train, x_test, y_test
 
+    def _split_output(self, output):
+        return super(EmailSpam, self)._split_output(output[1:])
+
 
 class HandwrittenDigit(Dataset):
     def __init__(self, *args, **kwargs):
@@ -201,44 +268,28 @@ class HandwrittenDigit(Dataset):
 
         super(HandwrittenDigit, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
+        self.dtype = np.dtype(kwargs.get("dtype", np.float32))
 
     def load(self):
         if self.verbose:
             print("Retrieving ESL-Handwritten_Digit dataset...")
 
-        self.download_file()
-
-        return self.__parse_file(self.target_filename)
+        return self.load_cached(
+            self.__parse_file,
+            self.target_filename,
+            attrs=("info",),
+            dtype=self.dtype.name,
+        )
 
     def __parse_file(self, target_filename):
-        x_train = []
-        y_train = []
-        with gzip.GzipFile(target_filename[1], "rb") as f:
-            for line in f.readlines():
-                temp = [
-                    float(i) for i in line.decode("utf-8").rstrip("\n").split(" ")[:-1]
-                ]
-                temp_y = temp[0]
-                temp_x = temp[1:]
-                x_train.append(temp_x)
-                y_train.append(temp_y)
-
-        x_train = np.array(x_train)
-        y_train = np.array(y_train)
-
-        x_test = []
-        y_test = []
-        with gzip.GzipFile(target_filename[2], "rb") as f:
-            for line in f.readlines():
-                temp = [float(i) for i in line.decode("utf-8").rstrip("\n").split(" ")]
-                temp_y = temp[0]
-                temp_x = temp[1:]
-                x_test.append(temp_x)
-                y_test.append(temp_y)
-
-        x_test = np.array(x_test)
-        y_test = np.array(y_test)
+        # each row is the digit followed by the 256 grayscale values
+        train = parse_table(read_text(target_filename[1]), dtype=self.dtype)
+        test = parse_table(read_text(target_filename[2]), dtype=self.dtype)
+
+        x_train = np.ascontiguousarray(train[:, 1:])
+        y_train = train[:, 0].astype(np.int64)
+        x_test = np.ascontiguousarray(test[:, 1:])
+        y_test = test[:, 0].astype(np.int64)
 
         with open(target_filename[0], "r") as f:
             self.info = f.read()
@@ -257,17 +308,17 @@ class NCI(Dataset):
 
         super(NCI, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
-
     def load(self):
         if self.verbose:
             print("Retrieving ESL-NCI dataset...")
 
         self.download_file()
 
-        return self.__parse_file(self.target_filename)
+        return self._parse(self.__parse_file, self.target_filename)
 
     def __parse_file(self, target_filename):
+        import pandas as pd
+
         df = pd.read_csv(target_filename[0])
         df.set_index("Unnamed: 0", drop=True, inplace=True)
         df = df.transpose()
@@ -279,3 +330,6 @@ class NCI(Dataset):
             self.info = f.read()
 
         return df, label
+
+    def _split_output(self, output):
+        raise TypeError("NCI.load() returns a DataFrame, not sample arrays")
@@ -1,8 +1,23 @@
+import gzip
 import os
 import tempfile
-import idx2numpy
-import gzip
 from ml_datasets.dataset import Dataset
+from ml_datasets.idx import (
+    check_classes,
+    check_splits,
+    class_rows,
+    decompress_idx,
+    is_stale,
+    load_idx,
+    read_idx,
+)
+from ml_datasets.layout import (
+    as_dtype,
+    check_dtype,
+    check_layout,
+    check_transform,
+    to_layout,
+)
 from numpy import rot90
 
 
@@ -15,15 +30,43 @@ class FashionMNIST(Dataset):
             "t10k-images-idx3-ubyte.gz",
             "t10k-labels-idx1-ubyte.gz",
         ]
+        kwargs["checksums"] = kwargs.get(
+            "checksums",
+            {
+                "train-images-idx3-ubyte.gz": {
+                    "md5": "8d4fb7e6c68d591d4c3dfef9ec88bf0d",
+                    "size": 26421880,
+                },
+                "train-labels-idx1-ubyte.gz": {
+                    "md5": "25c81989df183df01b3e8a0aad5dffbe",
+                    "size": 29515,
+                },
+                "t10k-images-idx3-ubyte.gz": {
+                    "md5": "bef4ecab320f06d8554ea6380940ec79",
+                    "size": 4422102,
+                },
+                "t10k-labels-idx1-ubyte.gz": {
+                    "md5": "bb300cfdad3c16e7a12a480ee83cd310",
+                    "size": 5148,
+                },
+            },
+        )
         kwargs["target_dir"] = kwargs.get(
             "target_dir", os.path.join(tempfile.gettempdir(), "fmnist")
         )
 
         super(FashionMNIST, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
         self.dataset = kwargs.get("dataset", "mnist")
         self.rotate = kwargs.get("rotate", False)
+        self.splits = check_splits(kwargs.get("splits", ("train", "test")))
+        # indexing and `len()` use the first loaded split unless told otherwise
+        self.split = kwargs.get("split", self.splits[0] if self.splits else "train")
+        self.labels_only = kwargs.get("labels_only", False)
+        self.classes = check_classes(kwargs.get("classes"))
+        self.layout = check_layout(kwargs.get("layout", "NHW"))
+        self.transform = check_transform(kwargs)
+        self.label_dtype = check_dtype(kwargs.get("label_dtype"))
         self.meta = {
             0: "T-shirt/top",
             1: "Trouser",
@@ -41,31 +84,65 @@ class FashionMNIST(Dataset):
         if self.verbose:
             print("Retrieving Fashion-MNIST-{} dataset...".format(self.dataset))
 
-        self.download_file()
-
-        return self.__parse_file(self.target_filename)
+        return self.load_cached(
+            self.__parse_file,
+            self.target_filename,
+            rotate=self.rotate,
+            splits=self.splits,
+            labels_only=self.labels_only,
+            classes=self.classes,
+            layout=self.layout,
+            label_dtype=self.label_dtype,
+            **self.transform
+        )
 
     def __parse_file(self, filenames):
-        output_ = dict()
-
+        files = dict()
         for filename in filenames:
             pre = "train" if "train" in filename else "test"
             post = [t for t in ["images", "labels"] if t in filename][0]
-            name = pre + "_" + post
+            files[pre + "_" + post] = filename
+
+        labels, images = {}, {}
+        for split in self.splits:
+            labels[split] = self.__load_idx(files[split + "_labels"])
+            rows = class_rows(labels[split], self.classes)
+            if rows is not None:
+                labels[split] = labels[split][rows]
+            labels[split] = as_dtype(labels[split], self.label_dtype)
 
-            with gzip.open(filename, "rb") as f:
-                array_temp = idx2numpy.convert_from_string(f.read())
+            if self.labels_only:
+                continue
 
-                if post == "images":
+            array_temp = self.__load_idx(files[split + "_images"], rows)
 
-                    if self.rotate:
-                        array_temp = rot90(array_temp, k=-1, axes=(-2, -1))[..., ::-1]
+            with self._phase("transform"):
+                if self.rotate:
+                    array_temp = rot90(array_temp, k=-1, axes=(-2, -1))[..., ::-1]
 
-                output_[name] = array_temp
+                images[split] = to_layout(
+                    array_temp, "NHW", self.layout, self.max_workers, **self.transform
+                )
 
         return (
-            output_["train_images"],
-            output_["train_labels"],
-            output_["test_images"],
-            output_["test_labels"],
+            images.get("train"),
+            labels.get("train"),
+            images.get("test"),
+            labels.get("test"),
         )
+
+    def __load_idx(self, filename, rows=None):
+        # the parsed arrays are cached, so the gzip stream is decoded directly
+        if self.cache:
+            with self._phase("decompress"), gzip.open(filename, "rb") as f:
+                return read_idx(f, self.chunk_size, rows)
+
+        idx_filename = filename[:-3] + ".idx"
+        if self.force or is_stale(idx_filename, filename):
+            with self._phase("decompress"):
+                decompress_idx(filename, idx_filename)
+            self._count("bytes_written", os.path.getsize(idx_filename))
+
+        # fancy indexing the memory-mapped sidecar reads only the selected rows
+        array_ = load_idx(idx_filename, self.mmap_mode)
+        return array_ if rows is None else array_[rows]
@@ -0,0 +1,166 @@
+import gzip
+import os
+import shutil
+import struct
+import numpy as np
+
+# type codes of the third magic byte, see http://yann.lecun.com/exdb/mnist/
+IDX_DTYPES = {
+    0x08: np.dtype("u1"),
+    0x09: np.dtype("i1"),
+    0x0B: np.dtype(">i2"),
+    0x0C: np.dtype(">i4"),
+    0x0D: np.dtype(">f4"),
+    0x0E: np.dtype(">f8"),
+}
+
+
+def read_header(f):
+    """
+    Parse the header of an IDX stream.
+
+    Arguments:
+        f: binary file object positioned at the start of the IDX data
+
+    Returns:
+        Tuple: `(dtype, shape, offset)` where `offset` is the size of the header
+    """
+    magic = f.read(4)
+    if len(magic) != 4 or magic[:2] != b"\x00\x00" or magic[2] not in IDX_DTYPES:
+        raise ValueError("invalid IDX magic number: {!r}".format(magic))
+
+    ndim = magic[3]
+    shape = struct.unpack(">" + "I" * ndim, f.read(4 * ndim))
+
+    return IDX_DTYPES[magic[2]], shape, 4 + 4 * ndim
+
+
+def load_idx(filename, mmap_mode="r"):
+    """
+    Open an uncompressed IDX file as a numpy array without copying it.
+
+    Arguments:
+        filename: path to the uncompressed IDX file
+        mmap_mode: mode passed to `np.memmap`, None reads the data into memory
+
+    Returns:
+        numpy array (a `np.memmap` unless `mmap_mode` is None)
+    """
+    with open(filename, "rb") as f:
+        dtype, shape, offset = read_header(f)
+
+    if mmap_mode is None:
+        count = int(np.prod(shape))
+        return np.fromfile(filename, dtype, count=count, offset=offset).reshape(shape)
+
+    return np.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+
+
+def read_idx(f, chunk_size=1 << 20, rows=None):
+    """
+    Decode an IDX stream (e.g. a `gzip.GzipFile`) into a preallocated array.
+
+    The data is read straight into the output buffer in `chunk_size` blocks, so no
+    intermediate file or bytes copy is made.
+
+    Arguments:
+        f: binary file object positioned at the start of the IDX data
+        chunk_size: number of bytes requested per `readinto` call
+        rows: optional sorted indices along the first axis; only these rows are kept and
+            the stream is not read past the last of them
+
+    Returns:
+        numpy array with the dtype and shape given by the header (the first dimension is
+            `len(rows)` when `rows` is given)
+    """
+    dtype, shape, _ = read_header(f)
+
+    if rows is None:
+        out = np.empty(shape, dtype)
+        _readinto(f, out, chunk_size)
+        return out
+
+    rows = np.asarray(rows, dtype=np.intp)
+    if len(rows) and (rows[0] < 0 or rows[-1] >= shape[0]):
+        raise IndexError("rows out of range for {} IDX records".format(shape[0]))
+
+    out = np.empty((len(rows),) + shape[1:], dtype)
+    row_size = max(int(np.prod(shape[1:])) * dtype.itemsize, 1)
+    block = np.empty((max(chunk_size // row_size, 1),) + shape[1:], dtype)
+    start = done = 0
+
+    while done < len(rows):
+        count = min(len(block), shape[0] - start)
+        _readinto(f, block[:count], chunk_size)
+
+        stop = done + np.searchsorted(rows[done:], start + count)
+        out[done:stop] = block[rows[done:stop] - start]
+        start, done = start + count, stop
+
+    return out
+
+
+def _readinto(f, out, chunk_size):
+    view = memoryview(out.reshape(-1).view(np.uint8))
+    pos = 0
+
+    while pos < len(view):
+        n = f.readinto(view[pos : pos + chunk_size])
+        if not n:
+            raise ValueError(
+                "truncated IDX data: {} of {} bytes".format(pos, len(view))
+            )
+        pos += n
+
+
+def decompress_idx(source, target, chunk_size=1 << 20):
+    """
+    Decompress a gzipped IDX file (path or binary file object) to `target`.
+
+    The data is streamed in `chunk_size` blocks and the target is only renamed into
+    place once it is complete.
+    """
+    with gzip.open(source, "rb") as f_in, open(target + ".tmp", "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, chunk_size)
+
+    os.replace(target + ".tmp", target)
+
+
+def is_stale(target, source):
+    return not os.path.isfile(target) or os.path.getmtime(target) < os.path.getmtime(
+        source
+    )
+
+
+def check_splits(splits):
+    """
+    Returns:
+        Tuple of the requested splits in `("train", "test")` order
+    """
+    splits = (splits,) if isinstance(splits, str) else tuple(splits)
+    unknown = set(splits) - {"train", "test"}
+    if unknown:
+        raise ValueError("unknown splits: {}".format(", ".join(sorted(unknown))))
+
+    return tuple(split for split in ("train", "test") if split in splits)
+
+
+def check_classes(classes):
+    """
+    Returns:
+        Sorted tuple of label values (hashable, so it can be part of a cache key), or
+            None to keep every class
+    """
+    return None if classes is None else tuple(sorted({int(c) for c in classes}))
+
+
+def class_rows(labels, classes):
+    """
+    Returns:
+        Sorted indices of the `labels` whose value is in `classes`, or None if `classes`
+            is None
+    """
+    if classes is None:
+        return None
+
+    return np.flatnonzero(np.isin(labels, classes))
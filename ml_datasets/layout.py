@@ -0,0 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+LAYOUTS = ("NHWC", "NCHW", "NHW")
+
+
+def check_layout(layout):
+    if layout not in LAYOUTS:
+        raise ValueError(
+            "incorrect value for arg: layout ({}): {}".format(
+                ", ".join(LAYOUTS), layout
+            )
+        )
+
+    return layout
+
+
+def check_dtype(dtype):
+    """
+    Returns:
+        Name of `dtype` (hashable, so it can be part of a cache key) or None
+    """
+    return None if dtype is None else np.dtype(dtype).name
+
+
+def as_dtype(array_, dtype):
+    return array_ if dtype is None else array_.astype(dtype, copy=False)
+
+
+def check_transform(kwargs):
+    """
+    Image conversion options of a loader: `dtype`, `scale`, `mean` and `std`.
+
+    The output is `((x * scale) - mean) / std` in `dtype`; `mean` and `std` are scalars
+    or per-channel sequences. Normalizing defaults to float32.
+
+    Returns:
+        dict of keyword arguments for `to_layout`
+    """
+    scale, mean, std = kwargs.get("scale"), kwargs.get("mean"), kwargs.get("std")
+    normalize = scale is not None or mean is not None or std is not None
+    dtype = check_dtype(kwargs.get("dtype") or ("float32" if normalize else None))
+
+    if normalize and not np.issubdtype(dtype, np.floating):
+        raise ValueError("normalization needs a floating dtype, got {}".format(dtype))
+
+    return {
+        "dtype": dtype,
+        "scale": None if scale is None else float(scale),
+        "mean": _as_floats(mean),
+        "std": _as_floats(std),
+    }
+
+
+def _as_floats(value):
+    if value is None or np.ndim(value) == 0:
+        return None if value is None else float(value)
+
+    return tuple(float(v) for v in value)
+
+
+def to_layout(
+    images,
+    source,
+    target,
+    max_workers=4,
+    chunk_size=1 << 20,
+    dtype=None,
+    scale=None,
+    mean=None,
+    std=None,
+):
+    """
+    Convert a batch of images between memory layouts and dtypes.
+
+    Arguments:
+        images: numpy array (or strided view) in the `source` layout
+        source: layout of `images`, one of `LAYOUTS`
+        target: layout of the output, one of `LAYOUTS`; "NHW" requires a single channel
+        max_workers: number of threads copying chunks
+        chunk_size: approximate number of bytes copied per chunk
+        dtype: dtype of the output (None keeps the dtype of `images`)
+        scale: optional factor the output is multiplied by
+        mean: optional scalar or per-channel value subtracted after scaling
+        std: optional scalar or per-channel value the output is divided by
+
+    Returns:
+        C-contiguous numpy array in the `target` layout
+    """
+    check_layout(target)
+    view = images
+
+    if source == "NHW" and target != "NHW":
+        view, source = view[..., None], "NHWC"
+
+    if target == "NHW" and source != "NHW":
+        if view.shape[source.index("C")] != 1:
+            raise ValueError(
+                "layout NHW needs single-channel images, got shape {}".format(
+                    view.shape
+                )
+            )
+        view = np.moveaxis(view, source.index("C"), -1)[..., 0]
+
+    elif target != source:
+        view = view.transpose([source.index(axis) for axis in target])
+
+    dtype = np.dtype(dtype or view.dtype)
+    if scale is None and mean is None and std is None:
+        return contiguous(view, max_workers, chunk_size, dtype)
+
+    # per-channel statistics broadcast along the channel axis of one image
+    shape = [1] * (view.ndim - 1)
+    if "C" in target:
+        shape[target.index("C") - 1] = -1
+    mean = None if mean is None else np.asarray(mean, dtype).reshape(shape)
+    std = None if std is None else np.asarray(std, dtype).reshape(shape)
+
+    def normalize(chunk):
+        if scale is not None:
+            chunk *= dtype.type(scale)
+        if mean is not None:
+            chunk -= mean
+        if std is not None:
+            chunk /= std
+
+    return contiguous(view, max_workers, chunk_size, dtype, normalize)
+
+
+def contiguous(array_, max_workers=4, chunk_size=1 << 20, dtype=None, transform=None):
+    """
+    C-contiguous copy of a strided view, made in chunks along the first axis.
+
+    The array is copied in cache-sized chunks by parallel threads, each chunk cast to
+    `dtype` and transformed in place; arrays that need no conversion are returned as is.
+    """
+    dtype = np.dtype(dtype or array_.dtype)
+    if array_.flags.c_contiguous and dtype == array_.dtype and transform is None:
+        return array_
+
+    out = np.empty(array_.shape, dtype)
+    if not out.size:
+        return out
+
+    rows = max(chunk_size // out[0].nbytes, 1)
+
+    def copy(start):
+        chunk = out[start : start + rows]
+        np.copyto(chunk, array_[start : start + rows], casting="unsafe")
+        if transform is not None:
+            transform(chunk)
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        list(executor.map(copy, range(0, len(out), rows)))
+
+    return out
@@ -0,0 +1,310 @@
+import mmap
+import multiprocessing
+import queue
+import traceback
+import uuid
+import weakref
+import numpy as np
+from ml_datasets.shared import attach, publish
+
+
+class DataLoader:
+    """
+    Prefetch minibatches of a `Dataset` split in a pool of worker processes.
+
+    The workers map the split (from the `.npy` cache, the dataset's shared memory or a
+    copy published for them) and gather batches into a ring of shared-memory slots, so
+    batches never pass through a pipe.
+
+    Arguments:
+        dataset: `ml_datasets.dataset.Dataset` instance
+        split: "train" or "test"
+        batch_size: number of samples per batch
+        shuffle: True to visit the samples in a new random order every epoch
+        seed: seed of the permutations (None for fresh ones)
+        drop_last: True to skip the final batch if it is smaller than `batch_size`
+        balanced: True to draw every batch with the same number of samples of each class
+            (see `ClassIndex.balanced_batches`), ignoring `shuffle` and `drop_last`
+        transform: optional picklable callable `transform(x, y) -> (x, y)` run by the
+            workers on every batch; it must keep the shapes (other than the batch
+            dimension) and dtypes of its output fixed
+        num_workers: number of worker processes
+        prefetch: number of batches in flight per worker
+        ordered: False to deliver batches as soon as any worker finishes them
+        context: multiprocessing start method ("fork", "spawn", ...), None for the
+            platform default
+        timeout: seconds to wait for a batch before checking that the workers are still
+            alive
+
+    Yields (per epoch, by iterating the loader):
+        Tuple of numpy arrays: `(x_batch, y_batch)`, views of a slot that are only valid
+            until the next batch is requested
+    """
+
+    def __init__(
+        self,
+        dataset,
+        split="train",
+        batch_size=32,
+        shuffle=False,
+        seed=None,
+        drop_last=False,
+        balanced=False,
+        transform=None,
+        num_workers=2,
+        prefetch=2,
+        ordered=True,
+        context=None,
+        timeout=5.0,
+    ):
+        self.dataset = dataset
+        self.split = split
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.balanced = balanced
+        self.transform = transform
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.ordered = ordered
+        self.timeout = timeout
+        self._rng = np.random.default_rng(seed)
+        self._context = multiprocessing.get_context(context)
+        self._workers = None
+        self._close = None
+
+    def __len__(self):
+        n = len(self.dataset.get_split(self.split)[1])
+        if self.balanced or self.drop_last:
+            return n // self.batch_size
+
+        return -(-n // self.batch_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        if self._workers is None:
+            self._start()
+
+        if self.balanced:
+            index = self.dataset.class_index(self.split)
+            tasks = list(index.balanced_batches(self.batch_size, seed=self._rng))
+
+        else:
+            n = len(self.dataset.get_split(self.split)[1])
+            stop = n - n % self.batch_size if self.drop_last else n
+            order = self._rng.permutation(n) if self.shuffle else None
+
+            tasks = []
+            for start in range(0, stop, self.batch_size):
+                end = min(start + self.batch_size, n)
+                if order is None:
+                    tasks.append(slice(start, end))
+                else:
+                    tasks.append(np.sort(order[start:end]))
+
+        free = list(range(len(self._slots) // 2))
+        done = {}
+        submitted = received = delivered = 0
+
+        try:
+            while delivered < len(tasks):
+                while free and submitted < len(tasks):
+                    self._tasks.put((submitted, free.pop(), tasks[submitted]))
+                    submitted += 1
+
+                if self.ordered and delivered in done:
+                    i = delivered
+                elif not self.ordered and done:
+                    i = next(iter(done))
+                else:
+                    i, slot, k = self._result()
+                    done[i] = (slot, k)
+                    received += 1
+                    continue
+
+                slot, k = done.pop(i)
+                delivered += 1
+
+                yield self._slots[2 * slot][:k], self._slots[2 * slot + 1][:k]
+                free.append(slot)
+
+        except GeneratorExit:
+            # the consumer stopped early: wait for the batches in flight so they
+            # are not written into the slots of the next epoch
+            try:
+                for _ in range(submitted - received):
+                    self._result()
+            except Exception:
+                self.close()
+            raise
+
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory; the next iteration starts a new
+        pool.
+        """
+        if self._close is not None:
+            self._close()
+        self._workers = self._close = None
+
+    def _start(self):
+        x, y = self.dataset.get_split(self.split)
+        name = "ml_datasets-{}".format(uuid.uuid4().hex[:12])
+
+        # the transform runs once here to find the shapes and dtypes of the slots
+        x_batch, y_batch = x[: self.batch_size], y[: self.batch_size]
+        if self.transform is not None:
+            x_batch, y_batch = self.transform(np.array(x_batch), np.array(y_batch))
+
+        slots = []
+        for _ in range(self.num_workers * self.prefetch):
+            for array_ in (np.asarray(x_batch), np.asarray(y_batch)):
+                slots.append(
+                    np.empty((self.batch_size,) + array_.shape[1:], array_.dtype)
+                )
+
+        # only the arrays the workers cannot map themselves are copied
+        sources, copies = [], []
+        for array_ in (x, y):
+            source = _source(array_, self.dataset._shared)
+            if source is None:
+                source = ("data", name + "-data", len(copies))
+                copies.append(array_)
+            sources.append(source)
+
+        shared = [publish(name + "-data", copies)] if copies else []
+        slots = publish(name + "-slots", slots)
+        shared.append(slots)
+        self._slots = slots.arrays
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._workers = [
+            self._context.Process(
+                target=_worker,
+                args=(name, sources, self.transform, self._tasks, self._results),
+                daemon=True,
+            )
+            for _ in range(self.num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        self._close = weakref.finalize(
+            self, _shutdown, self._workers, self._tasks, self._results, shared
+        )
+
+    def _result(self):
+        while True:
+            try:
+                i, slot, k, error = self._results.get(timeout=self.timeout)
+
+            except queue.Empty:
+                dead = [w.exitcode for w in self._workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(
+                        "DataLoader worker exited unexpectedly (exit code {})".format(
+                            dead[0]
+                        )
+                    ) from None
+                continue
+
+            if error is not None:
+                raise RuntimeError(
+                    "DataLoader worker failed on batch {}:\n{}".format(i, error)
+                )
+
+            return i, slot, k
+
+
+def _source(array_, shared):
+    """
+    Returns:
+        Tuple telling a worker where to map `array_` from, or None if it has to be
+            copied into shared memory
+    """
+    if shared is not None:
+        for i, shared_array in enumerate(shared.arrays):
+            if array_ is shared_array:
+                return ("shared", shared.name, i)
+
+    # a whole read-only `.npy` file, not a view of one
+    if (
+        isinstance(array_, np.memmap)
+        and isinstance(array_.base, mmap.mmap)
+        and array_.mode == "r"
+        and str(array_.filename).endswith(".npy")
+    ):
+        return ("npy", array_.filename)
+
+    return None
+
+
+def _worker(name, sources, transform, tasks, results):
+    # the parent holds the references and only releases them after joining (or
+    # terminating) the workers
+    attached = {}
+    arrays = []
+    for kind, path, *index in sources:
+        if kind == "npy":
+            arrays.append(np.load(path, mmap_mode="r", allow_pickle=False))
+        else:
+            if path not in attached:
+                attached[path] = attach(path, counted=False)
+            arrays.append(attached[path].arrays[index[0]])
+
+    slots = attach(name + "-slots", writeable=True, counted=False)
+    x, y = arrays
+
+    try:
+        for i, slot, index in iter(tasks.get, None):
+            x_out, y_out = slots.arrays[2 * slot], slots.arrays[2 * slot + 1]
+
+            try:
+                if transform is None:
+                    if isinstance(index, slice):
+                        k = len(y[index])
+                        x_out[:k], y_out[:k] = x[index], y[index]
+                    else:
+                        k = len(index)
+                        np.take(x, index, axis=0, out=x_out[:k])
+                        np.take(y, index, axis=0, out=y_out[:k])
+
+                else:
+                    x_batch, y_batch = transform(x[index], y[index])
+                    k = len(x_batch)
+                    x_out[:k], y_out[:k] = x_batch, y_batch
+
+                results.put((i, slot, k, None))
+
+            except Exception:
+                results.put((i, slot, 0, traceback.format_exc()))
+
+    except KeyboardInterrupt:
+        pass
+
+
+def _shutdown(workers, tasks, results, shared):
+    for _ in workers:
+        tasks.put(None)
+
+    for worker in workers:
+        worker.join(timeout=1.0)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+    for queue_ in (tasks, results):
+        queue_.close()
+        queue_.cancel_join_thread()
+
+    for shared_ in shared:
+        shared_.release()
@@ -17,12 +17,19 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-import zipfile
 import gzip
-import os
-import idx2numpy
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from numpy import rot90
 from ml_datasets.dataset import Dataset
+from ml_datasets.layout import (
+    as_dtype,
+    check_dtype,
+    check_layout,
+    check_transform,
+    to_layout,
+)
+from ml_datasets.idx import check_classes, check_splits, class_rows, read_idx
 
 
 class EMNIST(Dataset):
@@ -50,67 +57,138 @@ class EMNIST(Dataset):
     Arguments:
         dataset: type of datasets ("byclass", "bymerge", "balanced", "letters", "digits", "mnist")
         rotate: True or False (original data are not in the right orientation)
+        splits: splits to decode, e.g. `("test",)` for an evaluation job
+        labels_only: True to skip decoding the images
+        classes: optional label values to keep, e.g. `[0, 1, 2]`; the labels are decoded
+            first and only the matching image rows are kept
+        layout: memory layout of the C-contiguous images ("NHW", "NHWC" or "NCHW")
+        dtype: dtype of the images, e.g. "float32" (default: uint8)
+        scale, mean, std: normalization `(x * scale - mean) / std` applied in chunks
+            while the images are converted, e.g. `scale=1 / 255`
+        label_dtype: dtype of the labels (default: uint8)
 
     Returns:
-        Tuple of numpy arrays: `(x_train, y_train, x_test, y_test)`
+        Tuple of numpy arrays: `(x_train, y_train, x_test, y_test)`, with None in place
+            of the splits (or images) that were not requested
     """
 
     def __init__(self, *args, **kwargs):
         kwargs["url"] = "http://www.itl.nist.gov/iaui/vip/cs_links/EMNIST/"
         kwargs["filename"] = "gzip.zip"
+        kwargs["checksums"] = kwargs.get(
+            "checksums",
+            {
+                "gzip.zip": {
+                    "md5": "58c8d27c78d21e728a6bc7b3cc06412e",
+                    "size": 561753746,
+                }
+            },
+        )
 
         super(EMNIST, self).__init__(*args, **kwargs)
 
-        self.check_url(self.url)
         self.dataset = kwargs.get("dataset", "mnist")
         self.rotate = kwargs.get("rotate", True)
+        self.splits = check_splits(kwargs.get("splits", ("train", "test")))
+        # indexing and `len()` use the first loaded split unless told otherwise
+        self.split = kwargs.get("split", self.splits[0] if self.splits else "train")
+        self.labels_only = kwargs.get("labels_only", False)
+        self.classes = check_classes(kwargs.get("classes"))
+        self.layout = check_layout(kwargs.get("layout", "NHW"))
+        self.transform = check_transform(kwargs)
+        self.label_dtype = check_dtype(kwargs.get("label_dtype"))
 
     def load(self):
         if self.verbose:
             print("Retrieving EMNIST-{} dataset...".format(self.dataset))
 
-        self.download_file()
-
-        return self.__parse_file(self.target_filename)
+        return self.load_cached(
+            self.__parse_file,
+            self.target_filename,
+            dataset=self.dataset,
+            rotate=self.rotate,
+            splits=self.splits,
+            labels_only=self.labels_only,
+            classes=self.classes,
+            layout=self.layout,
+            label_dtype=self.label_dtype,
+            **self.transform
+        )
 
     def __parse_file(self, filename):
-        output_ = dict()
-        dir_name = os.path.dirname(filename)
-
         with zipfile.ZipFile(filename) as f_in:
-            datasets = [
-                f
+            members = {
+                self.__member_name(f): f
                 for f in f_in.namelist()
                 if "-" + self.dataset + "-" in f and f.endswith(".gz")
-            ]
-
-            for dataset in datasets:
-                dataset_with_full_path = os.path.join(dir_name, dataset)
-
-                if not os.path.isfile(dataset_with_full_path):
-                    f_in.extract(dataset, dir_name)
-
-                pre = [t for t in ["train", "test"] if t in dataset_with_full_path][0]
-                post = [t for t in ["images", "labels"] if t in dataset_with_full_path][
-                    0
-                ]
-                name = pre + "_" + post
-
-                with gzip.open(dataset_with_full_path, "rb") as f:
-                    array_temp = idx2numpy.convert_from_string(f.read())
-                    if post == "images":
-                        if self.rotate:
-                            array_temp = rot90(array_temp, k=-1, axes=(-2, -1))[
-                                ..., ::-1
-                            ]
-
-                    output_[name] = array_temp
+            }
+            if not members:
+                raise ValueError("unknown EMNIST dataset {!r}".format(self.dataset))
+
+            # zlib releases the GIL, so the members decompress concurrently
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                labels = dict(
+                    zip(
+                        self.splits,
+                        executor.map(
+                            lambda split: self.__read_member(
+                                f_in, members[split + "_labels"]
+                            ),
+                            self.splits,
+                        ),
+                    )
+                )
+                rows = {
+                    split: class_rows(labels[split], self.classes)
+                    for split in self.splits
+                }
+                if self.classes is not None:
+                    labels = {split: labels[split][rows[split]] for split in labels}
+
+                images = {}
+                if not self.labels_only:
+                    images = dict(
+                        zip(
+                            self.splits,
+                            executor.map(
+                                lambda split: self.__read_member(
+                                    f_in, members[split + "_images"], rows[split]
+                                ),
+                                self.splits,
+                            ),
+                        )
+                    )
+
+        for split in images:
+            with self._phase("transform"):
+                if self.rotate:
+                    images[split] = rot90(images[split], k=-1, axes=(-2, -1))[..., ::-1]
+
+                images[split] = to_layout(
+                    images[split],
+                    "NHW",
+                    self.layout,
+                    self.max_workers,
+                    **self.transform
+                )
+
+        labels = {split: as_dtype(labels[split], self.label_dtype) for split in labels}
 
         return (
-            output_["train_images"],
-            output_["train_labels"],
-            output_["test_images"],
-            output_["test_labels"],
+            images.get("train"),
+            labels.get("train"),
+            images.get("test"),
+            labels.get("test"),
         )
 
+    def __read_member(self, f_in, member, rows=None):
+        with self._phase("decompress"):
+            with f_in.open(member) as f, gzip.GzipFile(fileobj=f) as f_gz:
+                return read_idx(f_gz, self.chunk_size, rows)
+
+    @staticmethod
+    def __member_name(member):
+        pre = [t for t in ["train", "test"] if t in member][0]
+        post = [t for t in ["images", "labels"] if t in member][0]
 
+        return pre + "_" + post
@@ -0,0 +1,164 @@
+import copy
+import importlib
+
+# Metadata of every dataset, available without importing the loader modules (and
+# their numpy/pandas/rdata dependencies). "loader" is "<module>:<class>" and
+# "kwargs" are the constructor defaults used by `get`.
+DATASETS = {
+    "emnist": {
+        "loader": "ml_datasets.mnist:EMNIST",
+        "description": "EMNIST handwritten characters",
+        "files": ["gzip.zip"],
+        "sample_shape": (28, 28),
+        "dtype": "uint8",
+        "splits": {
+            "byclass": {"train": 697932, "test": 116323, "classes": 62},
+            "bymerge": {"train": 697932, "test": 116323, "classes": 47},
+            "balanced": {"train": 112800, "test": 18800, "classes": 47},
+            "letters": {"train": 124800, "test": 20800, "classes": 26},
+            "digits": {"train": 240000, "test": 40000, "classes": 10},
+            "mnist": {"train": 60000, "test": 10000, "classes": 10},
+        },
+        "kwargs": {},
+    },
+    "fashion-mnist": {
+        "loader": "ml_datasets.fmnist:FashionMNIST",
+        "description": "Fashion-MNIST article images",
+        "files": [
+            "train-images-idx3-ubyte.gz",
+            "train-labels-idx1-ubyte.gz",
+            "t10k-images-idx3-ubyte.gz",
+            "t10k-labels-idx1-ubyte.gz",
+        ],
+        "sample_shape": (28, 28),
+        "dtype": "uint8",
+        "splits": {"default": {"train": 60000, "test": 10000, "classes": 10}},
+        "kwargs": {},
+    },
+    "cifar10": {
+        "loader": "ml_datasets.cifar:CIFAR10",
+        "description": "CIFAR-10 tiny images",
+        "files": ["cifar-10-python.tar.gz", "cifar-10-binary.tar.gz"],
+        "sample_shape": (32, 32, 3),
+        "dtype": "uint8",
+        "splits": {"default": {"train": 50000, "test": 10000, "classes": 10}},
+        "kwargs": {},
+    },
+    "cifar100": {
+        "loader": "ml_datasets.cifar:CIFAR100",
+        "description": "CIFAR-100 tiny images",
+        "files": ["cifar-100-python.tar.gz", "cifar-100-binary.tar.gz"],
+        "sample_shape": (32, 32, 3),
+        "dtype": "uint8",
+        "splits": {
+            "fine": {"train": 50000, "test": 10000, "classes": 100},
+            "coarse": {"train": 50000, "test": 10000, "classes": 20},
+        },
+        "kwargs": {},
+    },
+    "esl-mixture": {
+        "loader": "ml_datasets.esl:Mixture",
+        "description": "ESL simulated two-class Gaussian mixture",
+        "files": ["ESL.mixture.rda"],
+        "sample_shape": (2,),
+        "dtype": "float64",
+        "splits": {"default": {"train": 200, "classes": 2}},
+        "kwargs": {},
+    },
+    "esl-prostate": {
+        "loader": "ml_datasets.esl:ProstateCancer",
+        "description": "ESL prostate cancer regression data",
+        "files": ["prostate.data", "prostate.info.txt"],
+        "sample_shape": (9,),
+        "dtype": "float64",
+        "splits": {"default": {"train": 67, "test": 30}},
+        "kwargs": {},
+    },
+    "esl-spam": {
+        "loader": "ml_datasets.esl:EmailSpam",
+        "description": "ESL e-mail spam word frequencies",
+        "files": ["spam.data", "spam.info.txt", "spam.traintest"],
+        "sample_shape": (57,),
+        "dtype": "float64",
+        "splits": {"default": {"train": 3065, "test": 1536, "classes": 2}},
+        "kwargs": {},
+    },
+    "esl-digit": {
+        "loader": "ml_datasets.esl:HandwrittenDigit",
+        "description": "ESL normalized handwritten zip code digits",
+        "files": ["zip.info.txt", "zip.train.gz", "zip.test.gz", "zip.digits"],
+        "sample_shape": (256,),
+        "dtype": "float32",
+        "splits": {"default": {"train": 7291, "test": 2007, "classes": 10}},
+        "kwargs": {},
+    },
+    "esl-nci": {
+        "loader": "ml_datasets.esl:NCI",
+        "description": "ESL NCI60 microarray gene expression",
+        "files": ["nci.data.csv", "nci.label.txt", "nci.info.txt"],
+        "sample_shape": (6830,),
+        "dtype": "float64",
+        "splits": {"default": {"train": 64}},
+        "kwargs": {},
+    },
+}
+
+
+def list_datasets():
+    """
+    Returns:
+        Sorted list of the names accepted by `get` and `info`
+    """
+    return sorted(DATASETS)
+
+
+def info(name):
+    """
+    Metadata of a dataset (files, sample shape, dtype and split sizes) without importing
+    its loader.
+
+    Arguments:
+        name: one of `list_datasets()`
+
+    Returns:
+        dict
+    """
+    return copy.deepcopy(_lookup(name))
+
+
+def get(name, **kwargs):
+    """
+    Create a dataset by name, importing its loader module on first use.
+
+    Arguments:
+        name: one of `list_datasets()`
+        kwargs: constructor arguments, e.g. `get("emnist", dataset="letters")`
+
+    Returns:
+        `ml_datasets.dataset.Dataset` instance; call `.load()` to retrieve the data
+    """
+    entry = _lookup(name)
+    module_name, class_name = entry["loader"].split(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+
+    return cls(**dict(entry["kwargs"], **kwargs))
+
+
+def register(name, loader, **metadata):
+    """
+    Add a dataset to the registry, e.g. `register("my-set", "my_pkg.data:MySet")`.
+    """
+    metadata.setdefault("kwargs", {})
+    DATASETS[name.lower()] = dict(metadata, loader=loader)
+
+
+def _lookup(name):
+    try:
+        return DATASETS[name.lower()]
+
+    except KeyError:
+        raise KeyError(
+            "unknown dataset {!r}, available: {}".format(
+                name, ", ".join(list_datasets())
+            )
+        ) from None
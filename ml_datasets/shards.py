@@ -0,0 +1,339 @@
+import glob
+import json
+import os
+import numpy as np
+
+INDEX = "index.json"
+FORMAT = 1
+
+
+class ShardReader:
+    """
+    Random access to one split written by `export_shards`.
+
+    Every shard is a raw file of `shard_size` samples memory-mapped on first use, so
+    sample `j` is row `j % shard_size` of shard `j // shard_size`.
+
+    Arguments:
+        directory: directory written by `export_shards`
+        split: "train" or "test"
+        mmap_mode: mode of the memory maps ("r", "r+" or "c")
+
+    Attributes:
+        attrs: dict of the dataset attributes exported with the shards (e.g. "meta")
+        shape, dtype: shape and dtype of the whole split of samples
+        label_shape, label_dtype: shape and dtype of the whole split of labels
+        shard_size: number of samples per shard
+        offsets: index of the first sample of every shard
+    """
+
+    def __init__(self, directory, split="train", mmap_mode="r"):
+        with open(os.path.join(directory, INDEX), "r") as f:
+            index = json.load(f)
+
+        if split not in index["splits"]:
+            raise ValueError(
+                "no {!r} split in {} (available: {})".format(
+                    split, directory, ", ".join(index["splits"])
+                )
+            )
+
+        entry = index["splits"][split]
+        self.directory = directory
+        self.split = split
+        self.mmap_mode = mmap_mode
+        self.attrs = index["attrs"]
+        self.shard_size = entry["shard_size"]
+        self.counts = entry["shards"]
+        self.offsets = np.array(entry["offsets"], dtype=np.int64)
+        self.shape = (entry["count"],) + tuple(entry["shape"])
+        self.dtype = np.dtype(entry["dtype"])
+        self.label_shape = (entry["count"],) + tuple(entry["label_shape"])
+        self.label_dtype = np.dtype(entry["label_dtype"])
+        self._shards = [None] * len(self.counts)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            i = int(index) + len(self) if index < 0 else int(index)
+            if not 0 <= i < len(self):
+                raise IndexError(
+                    "index {} is out of bounds for {} samples".format(index, len(self))
+                )
+
+            x, y = self.shard(i // self.shard_size)
+            return x[i % self.shard_size], y[i % self.shard_size]
+
+        if isinstance(index, slice):
+            return self.take(np.arange(*index.indices(len(self))))
+
+        return self.take(index)
+
+    def shard(self, i):
+        """
+        Returns:
+            Tuple of numpy arrays: `(x, y)`, the memory-mapped samples and labels of
+                shard `i`
+        """
+        if self._shards[i] is None:
+            data, labels = shard_filenames(self.directory, self.split, i)
+            x = np.memmap(
+                data,
+                dtype=self.dtype,
+                mode=self.mmap_mode,
+                shape=(self.counts[i],) + self.shape[1:],
+            )
+            y = np.load(labels, mmap_mode=self.mmap_mode, allow_pickle=False)
+            self._shards[i] = (x, y)
+
+        return self._shards[i]
+
+    def take(self, indices):
+        """
+        Gather samples from any shards, reading each shard once.
+
+        Returns:
+            Tuple of numpy arrays: `(x, y)`, in the order of `indices`
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError("indices out of bounds for {} samples".format(len(self)))
+
+        shards, rows = np.divmod(indices, self.shard_size)
+        x_out = np.empty(indices.shape + self.shape[1:], dtype=self.dtype)
+        y_out = np.empty(indices.shape + self.label_shape[1:], dtype=self.label_dtype)
+
+        for i in np.unique(shards):
+            selected = shards == i
+            x, y = self.shard(int(i))
+            x_out[selected] = x[rows[selected]]
+            y_out[selected] = y[rows[selected]]
+
+        return x_out, y_out
+
+    def iter_batches(self, batch_size=32, shuffle=False, seed=None, drop_last=False):
+        """
+        Iterate over minibatches, reading the shards one after the other.
+
+        With shuffling the shards, and the samples within each shard, are visited in
+        random order, so a batch reads from at most two shards.
+
+        Arguments:
+            batch_size: number of samples per batch
+            shuffle: True to visit the shards and their samples in random order
+            seed: seed of the permutations (None for fresh ones)
+            drop_last: True to skip the final batch if it is smaller than `batch_size`
+
+        Yields:
+            Tuple of numpy arrays: `(x_batch, y_batch)`
+        """
+        if not shuffle:
+            n = len(self)
+            stop = n - n % batch_size if drop_last else n
+
+            for start in range(0, stop, batch_size):
+                end = min(start + batch_size, n)
+                i, row = divmod(start, self.shard_size)
+
+                if (end - 1) // self.shard_size == i:
+                    x, y = self.shard(i)
+                    yield x[row : row + end - start], y[row : row + end - start]
+                else:
+                    yield self.take(np.arange(start, end))
+
+            return
+
+        rng = np.random.default_rng(seed)
+        left = self.offsets[:0]
+
+        for i in rng.permutation(len(self.counts)):
+            # the samples left over from the previous shard start the next batch
+            order = np.concatenate(
+                [left, self.offsets[i] + rng.permutation(self.counts[i])]
+            )
+            full = len(order) - len(order) % batch_size
+
+            for start in range(0, full, batch_size):
+                yield self.take(np.sort(order[start : start + batch_size]))
+
+            left = order[full:]
+
+        if len(left) and not drop_last:
+            yield self.take(np.sort(left))
+
+
+def shard_filenames(directory, split, i):
+    """
+    Returns:
+        Tuple: `(samples, labels)` paths of shard `i` of `split`
+    """
+    prefix = os.path.join(directory, "{}-{:05d}".format(split, i))
+    return prefix + ".bin", prefix + ".labels.npy"
+
+
+def write_shards(directory, split, batches, shard_bytes=1 << 28):
+    """
+    Write `(x, y)` batches of any size as fixed-size shards.
+
+    Arguments:
+        directory: output directory
+        split: name of the split, the prefix of the shard files
+        batches: iterable of `(x, y)` numpy arrays, e.g. `iter_batches()` or
+            `Mixture.sample()`; every batch is written as it arrives
+        shard_bytes: size of the sample file of a shard, rounded down to whole samples
+            (at least one)
+
+    Returns:
+        dict: the index entry of the split
+    """
+    os.makedirs(directory, exist_ok=True)
+    entry = {"count": 0, "shard_size": 1, "shards": [], "offsets": []}
+    entry.update(shape=[], dtype="|u1", label_shape=[], label_dtype="<i8")
+    f = labels = spec = None
+    filled = 0
+
+    def flush():
+        data_filename, labels_filename = shard_filenames(
+            directory, split, len(entry["shards"])
+        )
+        f.close()
+        os.replace(data_filename + ".tmp", data_filename)
+        with open(labels_filename + ".tmp", "wb") as f_labels:
+            np.save(f_labels, np.concatenate(labels), allow_pickle=False)
+        os.replace(labels_filename + ".tmp", labels_filename)
+
+        entry["offsets"].append(entry["count"])
+        entry["shards"].append(filled)
+        entry["count"] += filled
+
+    try:
+        for x, y in batches:
+            x, y = np.ascontiguousarray(x), np.asarray(y)
+            if not len(x):
+                continue
+
+            batch_spec = {
+                "shape": list(x.shape[1:]),
+                "dtype": x.dtype.str,
+                "label_shape": list(y.shape[1:]),
+                "label_dtype": y.dtype.str,
+            }
+            if spec is None:
+                spec = batch_spec
+                entry.update(spec)
+                entry["shard_size"] = max(1, shard_bytes // max(x[0].nbytes, 1))
+            elif batch_spec != spec:
+                raise ValueError(
+                    "all the batches of a split must have the same sample shapes "
+                    "and dtypes"
+                )
+
+            start = 0
+            while start < len(x):
+                if f is None:
+                    data_filename = shard_filenames(
+                        directory, split, len(entry["shards"])
+                    )[0]
+                    f = open(data_filename + ".tmp", "wb")
+                    labels, filled = [], 0
+
+                k = min(len(x) - start, entry["shard_size"] - filled)
+                x[start : start + k].tofile(f)
+                labels.append(y[start : start + k])
+                filled += k
+                start += k
+
+                if filled == entry["shard_size"]:
+                    flush()
+                    f = None
+
+        if f is not None:
+            flush()
+            f = None
+
+    finally:
+        if f is not None:
+            f.close()
+            os.remove(f.name)
+
+    return entry
+
+
+def export_shards(
+    dataset,
+    directory,
+    splits=None,
+    shard_bytes=1 << 28,
+    batch_size=4096,
+    transform=None,
+):
+    """
+    Export the splits of a `Dataset` as fixed-size shards readable with `ShardReader`.
+
+    The splits are read batch by batch, and the index is written last so a reader never
+    sees a partial export.
+
+    Arguments:
+        dataset: `ml_datasets.dataset.Dataset` instance
+        directory: output directory
+        splits: splits to export (default: "train" and "test" if present)
+        shard_bytes: size of the sample file of a shard
+        batch_size: number of samples read at once
+        transform: optional callable `transform(x, y) -> (x, y)` applied to every batch
+            before it is written, e.g. to export an augmented variant; it may change the
+            number of samples but not their shapes or dtypes
+
+    Returns:
+        Path of the index file
+    """
+    if splits is None:
+        splits = [
+            split
+            for split in ["train", "test"]
+            if _has_split(dataset, split) and dataset.get_split(split)[0] is not None
+        ]
+
+    os.makedirs(directory, exist_ok=True)
+    index = {"format": FORMAT, "splits": {}, "attrs": {}}
+    index_filename = os.path.join(directory, INDEX)
+
+    # the splits that are not exported again are kept
+    if os.path.isfile(index_filename):
+        with open(index_filename, "r") as f:
+            previous = json.load(f)["splits"]
+        index["splits"].update((k, v) for k, v in previous.items() if k not in splits)
+        os.remove(index_filename)
+
+    for split in splits:
+        for filename in glob.glob(os.path.join(glob.escape(directory), split + "-*")):
+            os.remove(filename)
+
+        batches = dataset.iter_batches(split, batch_size)
+        if transform is not None:
+            batches = (transform(x, y) for x, y in batches)
+
+        index["splits"][split] = write_shards(directory, split, batches, shard_bytes)
+
+    # array attributes are not exported, like the attributes of the cache manifest
+    for attr in dataset._attrs:
+        value = getattr(dataset, attr)
+        if not isinstance(value, np.ndarray):
+            index["attrs"][attr] = value
+
+    with open(index_filename + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_filename + ".tmp", index_filename)
+
+    return index_filename
+
+
+def _has_split(dataset, split):
+    try:
+        dataset.get_split(split)
+    except ValueError:
+        return False
+
+    return True
@@ -0,0 +1,226 @@
+import contextlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import weakref
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:  # Windows frees shared memory with its last handle
+    fcntl = None
+
+# the manifest block starts with the reference count and the size of its JSON
+HEADER = struct.Struct("<qq")
+LOCK_FILE = "ml_datasets-shared.lock"
+
+
+class SharedArrays:
+    """
+    Arrays published in (or attached from) named shared memory blocks.
+
+    Every `publish`/`attach` holds one reference and the last `release()` unlinks the
+    blocks; attached arrays are read-only by default.
+
+    Attributes:
+        name: name the arrays were published under
+        arrays: tuple of numpy arrays backed by the shared blocks (None entries are
+            kept)
+        attrs: dict of the attributes published with the arrays (e.g. "meta")
+    """
+
+    def __init__(self, name, manifest, blocks, arrays, attrs, counted=True):
+        self.name = name
+        self.arrays = arrays
+        self.attrs = attrs
+        if counted:
+            self._release = weakref.finalize(self, _release, name, manifest, blocks)
+        else:
+            self._release = lambda: None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def release(self):
+        self._release()
+
+
+def publish(name, output, attrs=None):
+    """
+    Copy arrays into named shared memory blocks so other processes can `attach` them
+    without parsing or copying the dataset again.
+
+    Arguments:
+        name: name of the dataset in shared memory (unique on the machine)
+        output: tuple of numpy arrays (or None), e.g. the output of `load()`
+        attrs: optional dict of JSON-serializable or numpy array attributes
+
+    Returns:
+        `SharedArrays` holding the first reference
+    """
+    blocks, specs, arrays = [], [], []
+    values, json_attrs, array_attrs = {}, {}, {}
+
+    def share(array_, key):
+        array_ = np.asarray(array_)
+        block = _open(
+            "{}-{}".format(name, key), create=True, size=max(array_.nbytes, 1)
+        )
+        blocks.append(block)
+        shared = _as_array(block, array_.shape, array_.dtype)
+        np.copyto(shared, array_)
+        spec = {"block": block.name, "shape": array_.shape, "dtype": array_.dtype.str}
+
+        return shared, spec
+
+    with _locked():
+        try:
+            for i, array_ in enumerate(output):
+                if array_ is None:
+                    specs.append(None)
+                    arrays.append(None)
+                    continue
+                shared, spec = share(array_, i)
+                specs.append(spec)
+                arrays.append(shared)
+
+            for attr, value in (attrs or {}).items():
+                if isinstance(value, np.ndarray):
+                    values[attr], array_attrs[attr] = share(value, attr)
+                else:
+                    values[attr] = json_attrs[attr] = value
+
+            # the manifest is created last, so `attach` never sees a partial dataset
+            data = json.dumps(
+                {"arrays": specs, "attrs": json_attrs, "array_attrs": array_attrs}
+            ).encode("utf-8")
+            manifest = _open(name, create=True, size=HEADER.size + len(data))
+            HEADER.pack_into(manifest.buf, 0, 1, len(data))
+            manifest.buf[HEADER.size : HEADER.size + len(data)] = data
+
+        except BaseException:
+            for block in blocks:
+                _unlink(block)
+            raise
+
+    return SharedArrays(name, manifest, blocks, tuple(arrays), values)
+
+
+def attach(name, writeable=False, counted=True):
+    """
+    Map arrays published under `name` by another process, without copying.
+
+    Arguments:
+        name: name passed to `publish`
+        writeable: True to map the arrays writeable instead of read-only
+        counted: False to map the arrays without taking a reference, for processes whose
+            lifetime the publisher controls (e.g. pool workers that may be terminated)
+
+    Returns:
+        `SharedArrays` holding a new reference
+    """
+    blocks = []
+
+    def view(spec):
+        block = _open(spec["block"])
+        blocks.append(block)
+        array_ = _as_array(block, spec["shape"], np.dtype(spec["dtype"]))
+        if not writeable:
+            array_.flags.writeable = False
+        return array_
+
+    with _locked():
+        manifest = _open(name)
+        if counted:
+            _add_ref(manifest, 1)
+
+        _, size = HEADER.unpack_from(manifest.buf, 0)
+        meta = json.loads(bytes(manifest.buf[HEADER.size : HEADER.size + size]))
+
+        arrays = tuple(None if spec is None else view(spec) for spec in meta["arrays"])
+        attrs = dict(meta["attrs"])
+        for attr, spec in meta["array_attrs"].items():
+            attrs[attr] = view(spec)
+
+    return SharedArrays(name, manifest, blocks, arrays, attrs, counted)
+
+
+def _release(name, manifest, blocks):
+    with _locked():
+        if _add_ref(manifest, -1) <= 0:
+            for block in [manifest] + blocks:
+                _unlink(block)
+
+
+class _Buffer:
+    """
+    Base object of the arrays mapped from a block, keeping the block open while any
+    view of it is alive.
+    """
+
+    def __init__(self, block, shape, dtype):
+        self.block = block
+        address = np.frombuffer(block.buf, np.uint8).ctypes.data
+        self.__array_interface__ = {
+            "data": (address, False),
+            "shape": tuple(shape),
+            "typestr": dtype.str,
+            "version": 3,
+        }
+
+
+def _as_array(block, shape, dtype):
+    return np.asarray(_Buffer(block, shape, dtype))
+
+
+def _open(name, create=False, size=0):
+    # the reference count decides when to unlink, not the exit of the process that
+    # happened to create or open the block; callers hold `_locked` so the
+    # register/unregister pairs of processes sharing a resource tracker never
+    # interleave
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+
+    block = shared_memory.SharedMemory(name, create=create, size=size)
+    if os.name == "posix":
+        resource_tracker.unregister(block._name, "shared_memory")
+
+    return block
+
+
+def _unlink(block):
+    # `unlink` unregisters the block from the resource tracker, undone by `_open`
+    if sys.version_info < (3, 13) and os.name == "posix":
+        resource_tracker.register(block._name, "shared_memory")
+
+    block.unlink()
+
+
+def _add_ref(manifest, delta):
+    refs, size = HEADER.unpack_from(manifest.buf, 0)
+    HEADER.pack_into(manifest.buf, 0, refs + delta, size)
+
+    return refs + delta
+
+
+@contextlib.contextmanager
+def _locked():
+    if fcntl is None:
+        yield
+        return
+
+    # one lock file for every name: a per-name file could not be removed safely
+    # while another process may be waiting on it, and would pile up in /tmp
+    path = os.path.join(tempfile.gettempdir(), LOCK_FILE)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,119 @@
+import contextlib
+import threading
+import time
+import tracemalloc
+
+# returned by `Dataset._phase` while no load is measured
+NO_PHASE = contextlib.nullcontext()
+
+
+class LoadStats:
+    """
+    Measurements of one `Dataset.load()` call.
+
+    Phases are timed inclusively and summed over threads, so they can add up to more
+    than `seconds`.
+
+    Attributes:
+        dataset: class name of the dataset
+        phases: dict of phase name -> seconds, e.g. "download", "check_url", "verify",
+            "parse", "extract", "decompress", "unpickle", "transform", "cache_write",
+            "cache_read"
+        calls: dict of phase name -> number of times it ran
+        bytes_downloaded: bytes received from the server
+        bytes_read: bytes of the raw files parsed or hashed, and of cached arrays read
+            eagerly (`mmap_mode=None`)
+        bytes_written: bytes of the cached arrays and decompressed sidecar files
+        cache: "hit", "miss" or "disabled" (None if the loader has no cache)
+        seconds: wall-clock duration of `load()`
+        peak_memory: peak bytes allocated through Python and numpy during `load()` above
+            the allocations at its start (None unless the dataset was created with
+            `trace_memory=True`)
+        error: name of the exception raised by `load()`, None if it succeeded
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.phases = {}
+        self.calls = {}
+        self.bytes_downloaded = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.cache = None
+        self.seconds = None
+        self.peak_memory = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "LoadStats({})".format(
+            ", ".join("{}={!r}".format(k, v) for k, v in self.as_dict().items())
+        )
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, counter, n):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + int(n))
+
+    def as_dict(self):
+        return {
+            "dataset": self.dataset,
+            "seconds": self.seconds,
+            "phases": dict(self.phases),
+            "calls": dict(self.calls),
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "cache": self.cache,
+            "peak_memory": self.peak_memory,
+            "error": self.error,
+        }
+
+
+def measure(load, dataset, trace_memory=False):
+    """
+    Run `load()` while `dataset._stats` collects a `LoadStats`.
+
+    Returns:
+        Tuple: `(output of load(), LoadStats)`; the stats are also attached to an
+            exception raised by `load()` as its `load_stats` attribute
+    """
+    stats = LoadStats(dataset.__class__.__name__)
+    started = trace_memory and not tracemalloc.is_tracing()
+
+    if trace_memory:
+        if started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+            tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    dataset._stats = stats
+    start = time.perf_counter()
+
+    try:
+        return load(), stats
+
+    except BaseException as e:
+        stats.error = type(e).__name__
+        e.load_stats = stats
+        raise
+
+    finally:
+        stats.seconds = time.perf_counter() - start
+        dataset._stats = None
+
+        if trace_memory:
+            stats.peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+            if started:
+                tracemalloc.stop()
@@ -0,0 +1,56 @@
+import gzip
+import numpy as np
+
+
+def read_text(filename):
+    """
+    Read a (possibly gzipped) text file as bytes, decompressing it once.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+
+    return data
+
+
+def parse_table(data, dtype=np.float64, skip_rows=0, replace=None):
+    """
+    Parse whitespace-delimited numeric text into a 2-D array with a single numpy call,
+    instead of splitting lines and converting every token in Python.
+
+    Arguments:
+        data: bytes (e.g. from `read_text`)
+        dtype: dtype of the output array
+        skip_rows: number of header lines to skip
+        replace: optional dict of byte strings replaced before parsing, e.g.
+            `{b"T": b"1", b"F": b"0"}` for a boolean column
+
+    Returns:
+        C-contiguous numpy array of shape `(rows, columns)`
+    """
+    if skip_rows:
+        data = data.split(b"\n", skip_rows)[-1]
+
+    for old, new in (replace or {}).items():
+        data = data.replace(old, new)
+
+    data = data.strip()
+    columns = len(data.split(b"\n", 1)[0].split())
+    values = np.fromstring(data, dtype=dtype, sep=" ")
+
+    if not columns or values.size % columns:
+        raise ValueError(
+            "ragged table: {} values in rows of {} columns".format(values.size, columns)
+        )
+
+    return values.reshape(-1, columns)
+
+
+def read_header(data, skip_rows=0):
+    """
+    Returns:
+        List of the whitespace-separated names on line `skip_rows` of `data`
+    """
+    return data.split(b"\n", skip_rows + 1)[skip_rows].decode("utf-8").split()
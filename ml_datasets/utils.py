@@ -1,14 +1,56 @@
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 import sys
 import numpy as np
-from matplotlib.colors import LinearSegmentedColormap
-from matplotlib.colors import BoundaryNorm
 
 
 def plot_images(
-    num_sample_perclass=10, x=None, y=None, labels=None, title=None, cmap=None
+    num_sample_perclass=10,
+    x=None,
+    y=None,
+    labels=None,
+    title=None,
+    cmap=None,
+    index=None,
+    renderer="montage",
+    filename=None,
+    pad=1,
+    dpi=100,
 ):
+    """
+    Plot the first `num_sample_perclass` images of every class in `labels`, one class
+    per row.
+
+    Arguments:
+        index: optional `ml_datasets.classes.ClassIndex` of `y` (e.g.
+            `dataset.class_index("train")`); built from `y` if not given
+        renderer: "montage" to tile the images into one canvas drawn with a single
+            `imshow`, "subplots" for one subplot per image
+        filename: optional image file (e.g. "emnist.png") to save the plot to instead of
+            showing it; the montage is then rendered without pyplot, so no display is
+            needed
+        pad: blank pixels between the montage tiles
+        dpi: resolution of the montage, every image pixel is drawn as 2x2 pixels of the
+            figure
+    """
+    from ml_datasets.classes import ClassIndex
+
+    if renderer not in ["montage", "subplots"]:
+        raise ValueError(
+            "incorrect value for arg: renderer (montage or subplots only): {}".format(
+                renderer
+            )
+        )
+
+    if index is None:
+        index = ClassIndex.from_labels(y)
+
+    if renderer == "montage":
+        rows = [index.rows(label)[:num_sample_perclass] for label in labels]
+        _plot_montage(x, rows, list(labels.values()), title, cmap, filename, pad, dpi)
+        return
+
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+
     grid_x = num_sample_perclass + 1
     grid_y = len(labels)
 
@@ -21,7 +63,7 @@ def plot_images(
     plt.suptitle(title)
     j = 0
     for i in range(grid_y):
-        idxs = [0] + list(np.where(y == list(labels.keys())[i])[0][: grid_x - 1])
+        idxs = [0] + list(index.rows(list(labels.keys())[i])[: grid_x - 1])
         label = labels[list(labels.keys())[i]]
 
         for k, idx in enumerate(idxs):
@@ -36,19 +78,165 @@ def plot_images(
             plt.axis("off")
             j += 1
 
-    plt.show()
+    if filename is not None:
+        plt.savefig(filename)
+        plt.close()
+    else:
+        plt.show()
+
+
+def montage(x, rows, columns=None, pad=1, gutter=0, fill=0):
+    """
+    Tile images into one canvas, one list of images per row of tiles.
+
+    The tiles are gathered with a single `np.take` and laid out with a reshape/transpose
+    of a preallocated `(rows, height, columns, width)` array, so the cost does not
+    depend on the number of tiles.
+
+    Arguments:
+        x: images of shape (N, H, W) or (N, H, W, C)
+        rows: sequence of index arrays, the images of every row of tiles
+        columns: number of tiles per row (default: the longest row); shorter rows are
+            filled with blank tiles and longer ones are cut
+        pad: blank pixels between neighbouring tiles
+        gutter: blank pixels on the left of the canvas, e.g. room for labels
+        fill: value of the blank pixels
+
+    Returns:
+        numpy array of `len(rows)` rows and `columns` columns of tiles, with a
+            `gutter` on the left
+    """
+    if columns is None:
+        columns = max([len(r) for r in rows] or [0])
+
+    index = np.full((len(rows), columns), -1, dtype=np.int64)
+    for i, r in enumerate(rows):
+        r = np.asarray(r)[:columns]
+        index[i, : len(r)] = r
+
+    valid = index >= 0
+    height, width = x.shape[1:3]
+    channels = x.shape[3:]
+
+    tiles = np.full((len(rows), columns) + x.shape[1:], fill, dtype=x.dtype)
+    tiles[valid] = np.take(x, index[valid], axis=0)
+
+    canvas = np.full(
+        (len(rows), height + pad, columns, width + pad) + channels,
+        fill,
+        dtype=x.dtype,
+    )
+    canvas[:, :height, :, :width] = tiles.swapaxes(1, 2)
+    canvas = canvas.reshape(
+        (len(rows) * (height + pad), columns * (width + pad)) + channels
+    )
+    canvas = canvas[: max(len(canvas) - pad, 0), : max(canvas.shape[1] - pad, 0)]
+
+    if gutter:
+        canvas = np.concatenate(
+            [np.full((len(canvas), gutter) + channels, fill, x.dtype), canvas], axis=1
+        )
+
+    return canvas
+
+
+def _plot_montage(x, rows, labels, title, cmap, filename, pad, dpi):
+    # channels-first (N, C, H, W) images are drawn channels-last
+    if x.ndim == 4 and x.shape[1] in (1, 3) and x.shape[-1] not in (1, 3):
+        x = x.transpose(0, 2, 3, 1)
+    if x.ndim == 4 and x.shape[-1] == 1:
+        x = x[..., 0]
+
+    height, width = x.shape[1:3]
+    gutter = 4 * width
+    canvas = montage(x, rows, pad=pad, gutter=gutter)
+
+    # the padding and the gutter are transparent, so the labels are drawn on the
+    # figure background whatever the colormap
+    blank = ~montage(np.broadcast_to(True, x.shape[:3]), rows, pad=pad, gutter=gutter)
+    if canvas.ndim == 2:
+        canvas = np.ma.masked_array(canvas, blank)
+    else:
+        alpha = np.where(blank, 0, 255 if canvas.dtype == np.uint8 else 1)
+        canvas = np.concatenate([canvas, alpha[..., None].astype(canvas.dtype)], -1)
+
+    # every image pixel is 2x2 figure pixels, the labels are 40% of a tile high
+    points = 2 * 72 / dpi
+    figsize = (2 * canvas.shape[1] / dpi, 2 * canvas.shape[0] / dpi + 0.5)
+
+    if filename is not None:
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=figsize, dpi=dpi)
+    else:
+        import matplotlib.pyplot as plt
 
+        fig = plt.figure(figsize=figsize, dpi=dpi)
+
+    ax = fig.add_axes([0, 0, 1, canvas.shape[0] / (canvas.shape[0] + dpi / 4)])
+    ax.imshow(canvas, cmap=cmap, interpolation="nearest")
+    ax.axis("off")
+
+    font = {"family": "serif", "weight": "bold", "size": 0.4 * height * points}
+    for i, label in enumerate(labels):
+        ax.text(
+            gutter - width / 4,
+            i * (height + pad) + height / 2,
+            label,
+            ha="right",
+            va="center",
+            fontdict=font,
+        )
+
+    if title is not None:
+        fig.suptitle(title)
+
+    if filename is not None:
+        fig.savefig(filename, bbox_inches="tight")
+    else:
+        plt.show()
+
+
+def plot_2D(x, y, title, axis="off", max_points=100000, bins=512, filename=None):
+    """
+    Plot 2-D points colored by class.
+
+    Up to `max_points` points every point is scattered; above it the classes are binned
+    into density rasters (see `density_raster`) drawn with a single `imshow`, so the
+    rendering time does not grow with the points.
+
+    Arguments:
+        x: array of shape (N, 2)
+        y: integer class of every point
+        max_points: number of points above which the density raster is drawn
+        bins: number of bins along each axis of the raster
+        filename: optional image file to save the plot to instead of showing it
+    """
+    import matplotlib.pyplot as plt
 
-def plot_2D(x, y, title, axis="off"):
     BLUE, ORANGE = "#57B5E8", "#E69E00"
     plt.figure(figsize=(8, 8))
-    plt.scatter(
-        x[:, 0],
-        x[:, 1],
-        s=18,
-        facecolors="none",
-        edgecolors=np.array([BLUE, ORANGE])[y],
-    )
+
+    if len(x) > max_points:
+        colors = [BLUE, ORANGE] + ["C{}".format(i) for i in range(2, 10)]
+        image, extent = density_raster(x, y, colors, bins)
+        plt.imshow(
+            image,
+            extent=extent,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+        )
+
+    else:
+        plt.scatter(
+            x[:, 0],
+            x[:, 1],
+            s=18,
+            facecolors="none",
+            edgecolors=np.array([BLUE, ORANGE])[y],
+        )
+
     if axis == "off":
         plt.axis("off")
     elif axis == "on":
@@ -59,10 +247,73 @@ def plot_2D(x, y, title, axis="off"):
         sys.exit()
 
     plt.title(title)
-    plt.show()
+
+    if filename is not None:
+        plt.savefig(filename)
+        plt.close()
+    else:
+        plt.show()
+
+
+def density_raster(x, y, colors, bins=512, chunk_size=1 << 20):
+    """
+    Bin 2-D points into one density raster per class and composite them.
+
+    The points are counted per class and bin `chunk_size` at a time; a bin is colored
+    by its class mix and its opacity grows with the log of its count.
+
+    Arguments:
+        x: array of shape (N, 2)
+        y: integer class of every point, in `[0, len(colors))`
+        colors: matplotlib color of every class
+        bins: number of bins along each axis
+        chunk_size: number of points binned at once
+
+    Returns:
+        Tuple: `(image, extent)`, an RGBA float array of shape (bins, bins, 4) (row 0 at
+            the bottom) and the `(left, right, bottom, top)` data coordinates it covers,
+            to be drawn with `imshow(image, extent=extent, origin="lower")`
+    """
+    from matplotlib.colors import to_rgb
+
+    low = np.min(x, axis=0).astype(np.float64)
+    high = np.max(x, axis=0).astype(np.float64)
+    # a unit-wide range along an axis where all the points have the same value
+    scale = bins / np.where(high > low, high - low, 1.0)
+
+    counts = np.zeros(len(colors) * bins * bins, dtype=np.int64)
+    for start in range(0, len(x), chunk_size):
+        points = np.asarray(x[start : start + chunk_size], dtype=np.float64)
+        classes = np.asarray(y[start : start + chunk_size], dtype=np.intp)
+        if classes.size and (classes.min() < 0 or classes.max() >= len(colors)):
+            raise ValueError("classes must be in [0, {})".format(len(colors)))
+
+        cells = ((points - low) * scale).astype(np.intp)
+        np.minimum(cells, bins - 1, out=cells)
+        counts += np.bincount(
+            (classes * bins + cells[:, 1]) * bins + cells[:, 0],
+            minlength=counts.size,
+        )
+
+    counts = counts.reshape(len(colors), bins, bins)
+    total = counts.sum(axis=0)
+
+    image = np.empty((bins, bins, 4))
+    rgb = np.array([to_rgb(color) for color in colors])
+    np.einsum("cij,ck->ijk", counts, rgb, out=image[..., :3])
+    image[..., :3] /= np.maximum(total, 1)[..., None]
+    image[..., 3] = np.log1p(total) / np.log1p(max(total.max(), 1))
+
+    extent = (low[0], low[0] + bins / scale[0], low[1], low[1] + bins / scale[1])
+
+    return image, extent
 
 
 def plot_dna(df, label):
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LinearSegmentedColormap
+    from matplotlib.colors import BoundaryNorm
+
     matrix = df.values
     col_names = df.columns
     rows = np.arange(matrix.shape[0])
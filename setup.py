@@ -15,12 +15,11 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*", "tests", "examples"]),
     install_requires=[
         "numpy",
         "requests>=2.24.0",
         "tqdm>=4.46.1",
-        "idx2numpy==1.2.2",
         "matplotlib>=3.2.2",
         "rdata>=0.2.1",
         "ipykernel==5.3.4",
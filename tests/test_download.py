@@ -0,0 +1,241 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.server import RangeHandler, serve
+from ml_datasets.dataset import MIN_SEGMENT_SIZE, Dataset
+
+FILENAME = "data.bin"
+SEGMENTS = 3
+
+
+class IgnoreRangeHandler(RangeHandler):
+    """Advertises `Accept-Ranges: bytes` but answers every request with 200."""
+
+    def send_head(self):
+        if "Range" in self.headers:
+            del self.headers["Range"]
+
+        return super().send_head()
+
+
+class RecordingHandler(RangeHandler):
+    """Keeps the Range header of every request, None for a plain GET."""
+
+    requests = []
+
+    def send_head(self):
+        self.requests.append(self.headers.get("Range"))
+        return super().send_head()
+
+
+@pytest.fixture
+def recorded():
+    RecordingHandler.requests = []
+    return RecordingHandler.requests
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "server"
+    directory.mkdir()
+    data = np.random.default_rng(0).bytes(SEGMENTS * MIN_SEGMENT_SIZE + 12345)
+    (directory / FILENAME).write_bytes(data)
+
+    return str(directory), data
+
+
+def make_dataset(url, target_dir, data, segments=1):
+    checksums = {FILENAME: {"sha256": hashlib.sha256(data).hexdigest()}}
+    checksums[FILENAME]["size"] = len(data)
+
+    return Dataset(
+        filename=FILENAME,
+        url=url,
+        target_dir=str(target_dir),
+        segments=segments,
+        checksums=checksums,
+        verbose=False,
+        offline=False,
+    )
+
+
+def read(dataset):
+    with open(dataset.target_filename, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("segments", [1, SEGMENTS])
+def test_segments_download_identical_files(tmp_path, source, segments):
+    directory, data = source
+    with serve(directory) as url:
+        dataset = make_dataset(url, tmp_path / "target", data, segments)
+        dataset.download_file()
+
+    assert read(dataset) == data
+    assert not os.path.exists(dataset.target_filename + ".part")
+
+
+def test_journal_resume(tmp_path, source):
+    directory, data = source
+    with serve(directory) as url:
+        dataset = make_dataset(url, tmp_path / "target", data, SEGMENTS)
+        part_filename = dataset.target_filename + ".part"
+
+        # every range stopped halfway, the rest of the file is still zeros
+        size = len(data)
+        bounds = [size * i // SEGMENTS for i in range(SEGMENTS + 1)]
+        ranges = [[(a + b) // 2, b] for a, b in zip(bounds, bounds[1:])]
+        partial = bytearray(size)
+        for (offset, _), start in zip(ranges, bounds):
+            partial[start:offset] = data[start:offset]
+
+        with open(part_filename, "wb") as f:
+            f.write(partial)
+        dataset._write_journal(part_filename, size, ranges)
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+    assert not os.path.exists(part_filename)
+    assert not os.path.exists(part_filename + ".json")
+
+
+@pytest.mark.parametrize("segments", [1, SEGMENTS])
+def test_ignored_range_falls_back_to_stream(tmp_path, source, segments):
+    directory, data = source
+    with serve(directory, IgnoreRangeHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data, segments)
+
+        # a truncated .part that would be resumed with a Range request
+        with open(dataset.target_filename + ".part", "wb") as f:
+            f.write(data[: len(data) // 3])
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+
+
+def test_ignored_range_on_journal_resume(tmp_path, source):
+    directory, data = source
+    with serve(directory, IgnoreRangeHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data, SEGMENTS)
+        part_filename = dataset.target_filename + ".part"
+
+        with open(part_filename, "wb") as f:
+            f.write(bytes(len(data)))
+        dataset._write_journal(part_filename, len(data), [[0, len(data)]])
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+    assert not os.path.exists(part_filename + ".json")
+
+
+def test_corrupted_file_downloaded_again(tmp_path, source):
+    directory, data = source
+    with serve(directory) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+
+        # same size as the manifest entry, wrong bytes
+        with open(dataset.target_filename, "wb") as f:
+            f.write(bytes(len(data)))
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+
+
+def test_oversized_part_downloaded_again(tmp_path, source):
+    directory, data = source
+    with serve(directory) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+
+        # the server answers 416 to a resume past the end of the file
+        with open(dataset.target_filename + ".part", "wb") as f:
+            f.write(bytes(len(data) + 1))
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+
+
+def test_segmented_download_probes_one_byte(tmp_path, source, recorded):
+    directory, data = source
+    with serve(directory, RecordingHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data, SEGMENTS)
+        dataset.download_file()
+
+    assert read(dataset) == data
+    # no request for the whole file is started and dropped
+    assert recorded[0] == "bytes=0-0"
+    assert len(recorded) == SEGMENTS + 1 and None not in recorded
+
+
+def test_truncated_part_resumes_missing_bytes(tmp_path, source, recorded):
+    directory, data = source
+    offset = len(data) // 3
+    with serve(directory, RecordingHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+        part_filename = dataset.target_filename + ".part"
+        with open(part_filename, "wb") as f:
+            f.write(data[:offset])
+
+        dataset.download_file()
+
+    assert recorded == ["bytes={}-".format(offset)]
+    assert read(dataset) == data
+    assert not os.path.exists(part_filename)
+
+
+def test_target_appears_only_when_complete(tmp_path, source):
+    directory, data = source
+    seen = []
+
+    class CheckingHandler(RangeHandler):
+        def send_head(self):
+            seen.append(os.path.exists(target_filename))
+            return super().send_head()
+
+    with serve(directory, CheckingHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+        target_filename = dataset.target_filename
+        with open(target_filename + ".part", "wb") as f:
+            f.write(data[:1000])
+
+        dataset.download_file()
+
+    assert seen == [False]
+    assert read(dataset) == data
+
+
+def test_complete_part_answered_416(tmp_path, source, recorded):
+    directory, data = source
+    with serve(directory, RecordingHandler) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+        with open(dataset.target_filename + ".part", "wb") as f:
+            f.write(bytes(len(data)))
+
+        dataset.download_file()
+
+    # the 416 drops the .part and the file is downloaded from the start
+    assert recorded == ["bytes={}-".format(len(data)), None]
+    assert read(dataset) == data
+
+
+def test_unreadable_marker_verifies_again(tmp_path, source):
+    directory, data = source
+    with serve(directory) as url:
+        dataset = make_dataset(url, tmp_path / "target", data)
+        dataset.download_file()
+
+        # truncated while it was written
+        with open(dataset.target_filename + ".verified", "w") as f:
+            f.write('{"sha256": ')
+
+        dataset.download_file()
+
+    assert read(dataset) == data
+    assert dataset._read_marker(dataset.target_filename) is not None